@@ -1,6 +1,9 @@
 """
 Application Entry Point
-نقطه ورود برنامه - برای اجرا در Render
+نقطه ورود برنامه
+
+production: gunicorn -c gunicorn.conf.py app:app
+توسعه محلی (یک پروسه): python app.py
 """
 
 import eventlet
@@ -10,11 +10,29 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     
     # Initialize Extensions
-    from app.extensions import db, migrate, limiter, socketio
+    from app.extensions import db, migrate, limiter, socketio, push_queue, read_receipts, message_writer, metrics, typing_tracker, message_archiver
+    from app.pubsub import socketio_queue_options
     db.init_app(app)
     migrate.init_app(app, db)
+    metrics.init_app(app)
     limiter.init_app(app)
-    socketio.init_app(app)
+    socketio.init_app(app, **socketio_queue_options(app.config))
+    push_queue.init_app(app)
+    read_receipts.init_app(app)
+    message_writer.init_app(app)
+    typing_tracker.init_app(app)
+    message_archiver.init_app(app)
+    
+    # Presence Backend & Caches
+    from app.services import StateManager, ProfileCache, UserDirectory, PageCache
+    StateManager.init_app(app)
+    ProfileCache.init_app(app)
+    UserDirectory.init_app(app)
+    PageCache.init_app(app)
+    
+    # Password Hashing
+    from app.passwords import PasswordHasher
+    PasswordHasher.init_app(app)
     
     # Register Blueprints
     from app.routes import register_blueprints
@@ -28,10 +46,9 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_user():
         from flask import session
-        from app.models import User
         user_id = session.get('current_user_id')
         if user_id:
-            return dict(current_user=User.query.get(user_id), current_user_id=user_id)
+            return dict(current_user=ProfileCache.get(user_id), current_user_id=user_id)
         return dict(current_user=None, current_user_id=None)
     
     return app
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Message Archive
+بایگانی پیام‌های قدیمی و پاک‌سازی نهایی پیام‌های حذف شده
+
+جدول message فقط پیام‌های اخیر را نگه می‌دارد تا ایندکس‌ها و vacuum آن با کل
+تاریخچه بزرگ نشوند. با MESSAGE_ARCHIVE_ENABLED یک thread پس‌زمینه هر
+MESSAGE_ARCHIVE_INTERVAL ثانیه:
+- پیام‌های حذف شده (tombstone های sync) را MESSAGE_PURGE_AFTER_DAYS روز بعد
+  از حذف کاملا پاک می‌کند.
+- پیام‌های قدیمی‌تر از MESSAGE_ARCHIVE_AFTER_DAYS را به message_archive منتقل
+  می‌کند. آخرین پیام هر مکالمه منتقل نمی‌شود، پس پیام‌های بایگانی شده هر
+  مکالمه همیشه از پیام‌های باقی‌مانده در message قدیمی‌ترند.
+
+روی PostgreSQL جدول message_archive بر اساس timestamp پارتیشن‌بندی ماهانه
+شده است. پارتیشن هر ماه هنگام اولین انتقال ساخته می‌شود و با
+toast_tuple_target کوچک، متن پیام‌ها (نه فقط متن‌های بالای 2KB) فشرده ذخیره
+می‌شود؛ پارتیشن ماه‌های قدیمی را می‌توان جدا (DETACH) یا به tablespace دیگری
+منتقل کرد. روی SQLite بایگانی یک جدول معمولی است.
+
+ChatService پیام‌های هر دو جدول را می‌خواند و ویرایش یا حذف پیام بایگانی
+شده هم مثل پیام‌های اخیر انجام می‌شود.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, text
+
+# کلید advisory lock روی PostgreSQL تا فقط یک worker همزمان بایگانی کند
+ARCHIVE_LOCK_KEY = 0x6d736761
+
+# حداقل toast_tuple_target مجاز؛ ردیف‌های بزرگتر از این فشرده می‌شوند
+TOAST_TUPLE_TARGET = 128
+
+
+def month_start(value):
+    """ابتدای ماه"""
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    """ابتدای ماه بعد"""
+    start = month_start(value)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(month):
+    """نام پارتیشن ماهانه message_archive"""
+    return f'message_archive_{month:%Y_%m}'
+
+
+class MessageArchiver:
+    """پاک‌سازی پیام‌های حذف شده و انتقال پیام‌های قدیمی به بایگانی"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._started = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """خواندن تنظیمات و راه‌اندازی thread در صورت فعال بودن"""
+        self.app = app
+        self.enabled = app.config.get('MESSAGE_ARCHIVE_ENABLED', False)
+        self.archive_after = timedelta(days=app.config.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180))
+        self.purge_after = timedelta(days=app.config.get('MESSAGE_PURGE_AFTER_DAYS', 30))
+        self.interval = app.config.get('MESSAGE_ARCHIVE_INTERVAL', 3600)
+        self.batch_size = app.config.get('MESSAGE_ARCHIVE_BATCH_SIZE', 5000)
+        if self.enabled:
+            self._start()
+
+    def _start(self):
+        """راه‌اندازی thread بایگانی دوره‌ای"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._archive_loop, name='message-archiver', daemon=True).start()
+
+    def _archive_loop(self):
+        """اجرای اول کمی بعد از راه‌اندازی و سپس هر MESSAGE_ARCHIVE_INTERVAL ثانیه"""
+        time.sleep(min(60, self.interval))
+        while True:
+            try:
+                with self.app.app_context():
+                    purged, archived = self.run()
+                if purged or archived:
+                    self.app.logger.info(f"Message archive: {archived} archived, {purged} purged")
+            except Exception as e:
+                print(f"Message archive failed: {e}")
+            time.sleep(self.interval)
+
+    def run(self, now=None):
+        """یک دور کامل پاک‌سازی و بایگانی - (تعداد پاک شده، تعداد بایگانی شده)"""
+        from app.models import MESSAGE_MODELS
+
+        now = now or datetime.utcnow()
+        purged = archived = 0
+
+        for model in MESSAGE_MODELS:
+            while True:
+                count = self._in_transaction(lambda: self.purge(model, now - self.purge_after))
+                purged += count
+                if count < self.batch_size:
+                    break
+
+        while True:
+            count = self._in_transaction(lambda: self.archive(now - self.archive_after))
+            archived += count
+            if count < self.batch_size:
+                break
+
+        return purged, archived
+
+    def _in_transaction(self, work):
+        """اجرای یک دسته در تراکنش جدا (روی PostgreSQL فقط اگر worker دیگری مشغول نباشد)"""
+        from app.extensions import db
+
+        try:
+            if db.session.get_bind().dialect.name == 'postgresql':
+                locked = db.session.execute(
+                    text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': ARCHIVE_LOCK_KEY}
+                ).scalar()
+                if not locked:
+                    db.session.rollback()
+                    return 0
+            count = work()
+            db.session.commit()
+            return count
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def _max_message_id():
+        """بزرگترین شناسه message - این پیام منتقل یا پاک نمی‌شود تا SQLite شناسه را دوباره استفاده نکند"""
+        from app.extensions import db
+        from app.models import Message
+
+        return db.session.query(func.max(Message.id)).scalar() or 0
+
+    def purge(self, model, cutoff):
+        """پاک کردن یک دسته از پیام‌هایی که قبل از cutoff حذف شده‌اند"""
+        from app.extensions import db
+
+        ids = [message_id for message_id, in db.session.query(model.id).filter(
+            model.is_deleted == True,
+            model.deleted_at < cutoff,
+            model.id < self._max_message_id()
+        ).order_by(model.deleted_at).limit(self.batch_size)]
+
+        if ids:
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        return len(ids)
+
+    def archive(self, cutoff):
+        """انتقال یک دسته از پیام‌های قدیمی‌تر از cutoff به message_archive"""
+        from app.extensions import db
+        from app.models import Message, ArchivedMessage, Conversation
+
+        # آخرین پیام مکالمه‌ها در message می‌ماند (ترتیب پیام‌های هر مکالمه بین دو جدول حفظ می‌شود)
+        is_last_message = select(Conversation.id).where(Conversation.last_message_id == Message.id).exists()
+        rows = db.session.query(Message.id, Message.timestamp).filter(
+            Message.is_deleted == False,
+            Message.timestamp < cutoff,
+            Message.id < self._max_message_id(),
+            ~is_last_message
+        ).order_by(Message.timestamp).limit(self.batch_size).all()
+        if not rows:
+            return 0
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            self._create_partitions(rows[0].timestamp, rows[-1].timestamp)
+
+        ids = [row.id for row in rows]
+        columns = [column.name for column in ArchivedMessage.__table__.columns]
+        db.session.execute(
+            insert(ArchivedMessage.__table__).from_select(
+                columns,
+                select(*[Message.__table__.c[name] for name in columns]).where(Message.id.in_(ids))
+            )
+        )
+        Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+        return len(ids)
+
+    @staticmethod
+    def _create_partitions(first, last):
+        """ساخت پارتیشن ماه‌های بین first و last (در صورت نبود)"""
+        from app.extensions import db
+
+        month = month_start(first)
+        while month <= last:
+            db.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF message_archive "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}') "
+                f"WITH (toast_tuple_target = {TOAST_TUPLE_TARGET})"
+            ))
+            month = next_month(month)
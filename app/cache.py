@@ -0,0 +1,63 @@
+"""
+In-Process Caches
+cache های داخل پروسه
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """cache با سیاست LRU و انقضای زمانی (thread-safe)"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        """تغییر اندازه یا TTL (مقادیر فعلی پاک می‌شوند)"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key, default=None):
+        """دریافت مقدار در صورت وجود و منقضی نشدن"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """ذخیره مقدار و حذف قدیمی‌ترین مورد در صورت پر بودن"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """حذف یک کلید"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """پاک کردن کل cache"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
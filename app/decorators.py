@@ -3,8 +3,12 @@ Custom Decorators
 دکوراتورهای سفارشی
 """
 
+import math
+import time
 from functools import wraps
-from flask import session, redirect, url_for, flash
+from flask import session, redirect, url_for, flash, request
+from flask_limiter.util import get_remote_address
+from limits import parse_many
 
 
 def login_required(f):
@@ -15,4 +19,37 @@ def login_required(f):
             flash('برای دسترسی به این صفحه باید وارد شوید.', 'info')
             return redirect(url_for('auth.show_auth_page'))
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def socket_rate_limit(limit_value):
+    """محدودیت نرخ هندلر Socket.IO با همان storage و strategy مسیرهای HTTP (limiter)
+
+    مثل limiter.limit یک رشته مثل "30 per 10 seconds" می‌گیرد. کلید محدودیت
+    شناسه کاربر (یا آدرس IP برای اتصال بدون ورود) و نام رویداد است. در صورت
+    عبور از محدودیت هندلر اجرا نمی‌شود و ack با خطای rate_limited برمی‌گردد.
+    """
+    limits = parse_many(limit_value)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from app.extensions import limiter
+
+            if not limiter.enabled:
+                return f(*args, **kwargs)
+
+            user_id = session.get('current_user_id')
+            identity = f'user:{user_id}' if user_id else get_remote_address()
+            event_name = request.event['message']
+            try:
+                for item in limits:
+                    if not limiter.limiter.hit(item, 'socketio', event_name, identity):
+                        reset_time = limiter.limiter.get_window_stats(item, 'socketio', event_name, identity)[0]
+                        return {'error': 'rate_limited', 'retry_after': max(1, math.ceil(reset_time - time.time()))}
+            except Exception as e:
+                # در صورت در دسترس نبودن storage رویداد رد نمی‌شود
+                print(f"Socket rate limit check failed: {e}")
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
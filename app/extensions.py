@@ -8,6 +8,12 @@ from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_socketio import SocketIO
+from app.archive import MessageArchiver
+from app.metrics import Metrics
+from app.push import PushDeliveryQueue
+from app.receipts import ReadReceiptBatcher
+from app.typing_indicator import TypingTracker
+from app.writer import MessageWriter
 
 # Database
 db = SQLAlchemy()
@@ -15,14 +21,31 @@ db = SQLAlchemy()
 # Migration
 migrate = Migrate()
 
-# Rate Limiter
+# Rate Limiter (storage و strategy از RATELIMIT_STORAGE_URI و RATELIMIT_STRATEGY در config)
 limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri="memory://"
+    key_func=get_remote_address
 )
 
 # SocketIO
 socketio = SocketIO(
     cors_allowed_origins="*",
     async_mode='eventlet'
-)
\ No newline at end of file
+)
+
+# Web Push Delivery Queue
+push_queue = PushDeliveryQueue()
+
+# Read Receipts
+read_receipts = ReadReceiptBatcher()
+
+# Typing Indicator
+typing_tracker = TypingTracker()
+
+# Write-Behind Message Writer
+message_writer = MessageWriter()
+
+# Message Archive (پاک‌سازی و بایگانی پیام‌های قدیمی)
+message_archiver = MessageArchiver()
+
+# Instrumentation (/metrics)
+metrics = Metrics()
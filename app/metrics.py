@@ -0,0 +1,246 @@
+"""
+Instrumentation
+اندازه‌گیری زمان، تعداد و زمان کوئری‌های هر endpoint و رویداد Socket.IO
+
+با METRICS_ENABLED برای هر درخواست HTTP (بر اساس endpoint) و هر رویداد
+Socket.IO (بر اساس نام رویداد) این مقادیر جمع می‌شود:
+- زمان کل (histogram)
+- تعداد و زمان کوئری‌های دیتابیس (رویدادهای engine در SQLAlchemy)
+- تعداد خطاها
+
+عملیات کندتر از METRICS_SLOW_THRESHOLD همراه با SQL کوئری‌هایش لاگ
+می‌شود و آمار با فرمت Prometheus در /metrics در دسترس است. وقتی
+غیرفعال است هیچ hook یا listener ثبت نمی‌شود.
+"""
+
+import inspect
+import threading
+import time
+from functools import wraps
+from flask import Response, request, abort
+from sqlalchemy import event
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Operation:
+    """وضعیت یک درخواست یا رویداد در حال اجرا"""
+
+    __slots__ = ('started', 'queries', 'db_time', 'statements', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []  # (seconds, sql)
+        self.status = None
+
+
+class _Stats:
+    """آمار تجمعی یک endpoint یا رویداد"""
+
+    __slots__ = ('count', 'errors', 'slow', 'total_time', 'queries', 'db_time', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.total_time = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class Metrics:
+    """جمع‌آوری آمار درخواست‌ها و رویدادها"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}  # (kind, name) -> _Stats
+
+    def init_app(self, app):
+        """ثبت hook ها فقط در صورت فعال بودن"""
+        self.app = app
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+
+        self.slow_threshold = app.config.get('METRICS_SLOW_THRESHOLD', 0.5)
+        self.sql_limit = app.config.get('METRICS_SLOW_SQL_LIMIT', 20)
+        self.token = app.config.get('METRICS_TOKEN')
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        from app.extensions import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # ==================== HTTP ====================
+
+    def _before_request(self):
+        self._local.operation = _Operation()
+
+    def _after_request(self, response):
+        operation = getattr(self._local, 'operation', None)
+        if operation is not None:
+            operation.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        """ثبت در teardown تا درخواست‌های منجر به exception هم شمرده شوند"""
+        operation = getattr(self._local, 'operation', None)
+        if operation is None:
+            return
+        self._local.operation = None
+        failed = exc is not None or operation.status is None or operation.status >= 500
+        self._record('http', request.endpoint or '<unmatched>', operation, failed)
+
+    # ==================== Socket.IO ====================
+
+    def socket_handler(self, socketio):
+        """جایگزین socketio.on که هندلر را اندازه‌گیری می‌کند
+
+        در حالت غیرفعال خود socketio.on برگردانده می‌شود.
+        """
+        if not self.enabled:
+            return socketio.on
+
+        def on(message, namespace=None):
+            def decorator(handler):
+                # هندلرهای بدون پارامتر (connect، heartbeat) بدون آرگومان صدا زده می‌شوند
+                takes_args = bool(inspect.signature(handler).parameters)
+
+                @wraps(handler)
+                def instrumented(*args):
+                    operation = self._local.operation = _Operation()
+                    failed = True
+                    try:
+                        result = handler(*args) if takes_args else handler()
+                        failed = False
+                        return result
+                    finally:
+                        self._local.operation = None
+                        self._record('socket', message, operation, failed)
+
+                socketio.on(message, namespace)(instrumented)
+                return handler
+            return decorator
+        return on
+
+    # ==================== SQLAlchemy ====================
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'operation', None) is not None:
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        operation = getattr(self._local, 'operation', None)
+        starts = conn.info.get('metrics_query_start')
+        if operation is None or not starts:
+            return
+
+        elapsed = time.perf_counter() - starts.pop()
+        operation.queries += 1
+        operation.db_time += elapsed
+        if len(operation.statements) < self.sql_limit:
+            operation.statements.append((elapsed, statement))
+
+    # ==================== Recording ====================
+
+    def _record(self, kind, name, operation, failed):
+        """افزودن یک عملیات به آمار و لاگ در صورت کند بودن"""
+        elapsed = time.perf_counter() - operation.started
+        slow = elapsed >= self.slow_threshold
+
+        with self._lock:
+            stats = self._stats.get((kind, name))
+            if stats is None:
+                stats = self._stats[(kind, name)] = _Stats()
+            stats.count += 1
+            stats.errors += failed
+            stats.slow += slow
+            stats.total_time += elapsed
+            stats.queries += operation.queries
+            stats.db_time += operation.db_time
+            for index, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    stats.buckets[index] += 1
+                    break
+
+        if slow:
+            self._log_slow(kind, name, elapsed, operation)
+
+    def _log_slow(self, kind, name, elapsed, operation):
+        """لاگ عملیات کند همراه با کندترین کوئری‌ها"""
+        lines = [
+            f"Slow {kind} {name}: {elapsed * 1000:.1f}ms, "
+            f"{operation.queries} queries ({operation.db_time * 1000:.1f}ms in DB)"
+        ]
+        for seconds, statement in sorted(operation.statements, key=lambda item: item[0], reverse=True)[:10]:
+            sql = ' '.join(statement.split())
+            lines.append(f"  {seconds * 1000:8.1f}ms  {sql[:500]}")
+        if operation.queries > len(operation.statements):
+            lines.append(f"  ... {operation.queries - len(operation.statements)} more queries not captured")
+        self.app.logger.warning('\n'.join(lines))
+
+    # ==================== Prometheus ====================
+
+    def metrics_view(self):
+        """آمار با فرمت متنی Prometheus"""
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            abort(403)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    def render(self):
+        """تبدیل آمار به فرمت Prometheus"""
+        with self._lock:
+            snapshot = [
+                (kind, name, stats.count, stats.errors, stats.slow, stats.total_time,
+                 stats.queries, stats.db_time, list(stats.buckets))
+                for (kind, name), stats in sorted(self._stats.items())
+            ]
+
+        duration = [
+            '# HELP app_operation_duration_seconds Wall time of HTTP requests and Socket.IO events.',
+            '# TYPE app_operation_duration_seconds histogram',
+        ]
+        counters = {
+            'app_operation_errors_total': ('Failed operations (exception or 5xx).', []),
+            'app_operation_slow_total': ('Operations slower than the slow threshold.', []),
+            'app_db_queries_total': ('Database queries executed.', []),
+            'app_db_duration_seconds_total': ('Time spent in database queries.', []),
+        }
+
+        for kind, name, count, errors, slow, total_time, queries, db_time, buckets in snapshot:
+            labels = f'kind="{kind}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                duration.append(f'app_operation_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            duration.append(f'app_operation_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            duration.append(f'app_operation_duration_seconds_sum{{{labels}}} {total_time:.6f}')
+            duration.append(f'app_operation_duration_seconds_count{{{labels}}} {count}')
+
+            counters['app_operation_errors_total'][1].append(f'{{{labels}}} {errors}')
+            counters['app_operation_slow_total'][1].append(f'{{{labels}}} {slow}')
+            counters['app_db_queries_total'][1].append(f'{{{labels}}} {queries}')
+            counters['app_db_duration_seconds_total'][1].append(f'{{{labels}}} {db_time:.6f}')
+
+        lines = duration
+        for metric, (help_text, samples) in counters.items():
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            lines.extend(f'{metric}{sample}' for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    """escape مقدار label در فرمت Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
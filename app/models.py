@@ -4,7 +4,10 @@ Database Models
 """
 
 from app.extensions import db
-from sqlalchemy import func, Index
+from sqlalchemy import func, Index, text, and_, event
+from sqlalchemy.orm import declared_attr
+from app.storage import file_url
+from app.thumbnails import ThumbnailService
 
 class User(db.Model):
     """مدل کاربر"""
@@ -13,17 +16,23 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True, index=True)
     major = db.Column(db.String(100))
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, server_default=func.now())
     theme = db.Column(db.String(20), default='light')  # light or dark
+    # نام نرمال شده برای جستجوی کاربران (با تغییر name خودکار پر می‌شود - app/search.py)
+    search_name = db.Column(db.String(100), nullable=True)
+    
+    __table_args__ = (
+        Index('idx_user_search_name', 'search_name', 'id'),
+        Index('idx_user_major_search_name', 'major', 'search_name', 'id'),
+    )
     
     def __repr__(self):
         return f'<User {self.name}>'
 
 
-class Message(db.Model):
-    """مدل پیام"""
-    __tablename__ = 'message'
+class MessageBase:
+    """ستون‌ها و رفتار مشترک پیام‌های فعال (message) و بایگانی شده (message_archive)"""
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -33,19 +42,225 @@ class Message(db.Model):
     read_at = db.Column(db.DateTime, nullable=True)
     edited_at = db.Column(db.DateTime, nullable=True)
     is_deleted = db.Column(db.Boolean, default=False)
+    # زمان حذف - پیام حذف شده بعد از MESSAGE_PURGE_AFTER_DAYS کاملا پاک می‌شود (app/archive.py)
+    deleted_at = db.Column(db.DateTime, nullable=True)
     
     # File attachment fields
     file_path = db.Column(db.String(500), nullable=True)
     file_name = db.Column(db.String(255), nullable=True)
     file_type = db.Column(db.String(50), nullable=True)
     file_size = db.Column(db.Integer, nullable=True)
+    file_hash = db.Column(db.String(64), db.ForeignKey('file_blob.sha256'), nullable=True, index=True)
+    
+    # متن نرمال شده برای ایندکس جستجو (app/search.py)
+    search_text = db.Column(db.Text, nullable=True)
+    
+    # شناسه ساخته شده توسط کلاینت برای ارسال مجدد بدون تکرار (write-behind)
+    client_id = db.Column(db.String(36), nullable=True)
+    
+    # شماره آخرین رویداد (ارسال، ویرایش یا حذف) این پیام در مکالمه - برای sync
+    seq = db.Column(db.Integer, nullable=True)
+    
+    # کلید مکالمه: جفت (کوچکتر، بزرگتر) فرستنده و گیرنده، هنگام درج پر می‌شود
+    # تا پیام‌های هر دو جهت یک مکالمه در یک بازه پیوسته از ایندکس باشند
+    user_lo_id = db.Column(db.Integer, nullable=True)
+    user_hi_id = db.Column(db.Integer, nullable=True)
+    
+    @declared_attr
+    def blob(cls):
+        return db.relationship('FileBlob')
+    
+    @property
+    def room(self):
+        """نام اتاق Socket.IO مکالمه این پیام"""
+        return Conversation.room(self.user_lo_id, self.user_hi_id)
+    
+    @property
+    def file_url(self):
+        """آدرس دانلود فایل ضمیمه"""
+        return file_url(self.file_path) if self.file_path else None
+    
+    @property
+    def file_info(self):
+        """اطلاعات فایل ضمیمه برای ارسال به کلاینت (همراه با پیش‌نمایش تصاویر)"""
+        if not self.file_path:
+            return None
+        
+        info = {
+            'name': self.file_name,
+            'type': self.file_type,
+            'size': self.file_size,
+            'url': self.file_url
+        }
+        
+        blob = self.blob
+        if blob and blob.width and ThumbnailService.is_image(self.file_type):
+            info['width'] = blob.width
+            info['height'] = blob.height
+            info['thumbnails'] = ThumbnailService.thumbnails_for(blob.sha256, blob.width, blob.height)
+        return info
+    
+    def to_dict(self):
+        """تبدیل پیام به دیکشنری برای ارسال به کلاینت"""
+        data = {
+            'message_id': self.id,
+            'seq': self.seq,
+            'sender_id': self.sender_id,
+            'receiver_id': self.receiver_id,
+            'content': self.content,
+            'timestamp': self.timestamp.strftime('%H:%M') if self.timestamp else None,
+            'timestamp_iso': self.timestamp.isoformat() if self.timestamp else None,
+            'client_id': self.client_id,
+            'edited': self.edited_at is not None,
+            'read': self.read_at is not None
+        }
+        
+        # اضافه کردن اطلاعات فایل
+        if self.file_path:
+            data['file'] = self.file_info
+        return data
+    
+    def __repr__(self):
+        return f'<{type(self).__name__} from {self.sender_id} to {self.receiver_id}>'
+
+
+# شرط پیام‌های حذف شده (پاک‌سازی نهایی) و حذف نشده (ایندکس‌های جزئی)
+_DELETED = {'sqlite_where': text('is_deleted = 1'), 'postgresql_where': text('is_deleted = true')}
+_LIVE = {'sqlite_where': text('is_deleted = 0'), 'postgresql_where': text('is_deleted = false')}
+_UNREAD = {'sqlite_where': text('read_at IS NULL AND is_deleted = 0'),
+           'postgresql_where': text('read_at IS NULL AND is_deleted = false')}
+
+
+class Message(MessageBase, db.Model):
+    """مدل پیام (پیام‌های اخیر؛ پیام‌های قدیمی به message_archive منتقل می‌شوند)"""
+    __tablename__ = 'message'
 
     __table_args__ = (
-        Index('idx_sender_receiver_timestamp', 'sender_id', 'receiver_id', 'timestamp'),
+        # تاریخچه چت (فقط پیام‌های حذف نشده؛ هر دو جهت مکالمه با یک range scan)
+        Index('idx_message_conversation_live', 'user_lo_id', 'user_hi_id', 'timestamp', 'id', **_LIVE),
+        # پیام‌های خوانده نشده هر گیرنده (ثبت watermark خواندن)
+        Index('idx_message_unread', 'receiver_id', 'sender_id', 'id', **_UNREAD),
+        Index('uq_message_sender_client', 'sender_id', 'client_id', unique=True),
+        Index('idx_message_conversation_seq', 'user_lo_id', 'user_hi_id', 'seq'),
+        Index('idx_message_deleted', 'deleted_at', **_DELETED),
     )
+
+
+class ArchivedMessage(MessageBase, db.Model):
+    """پیام بایگانی شده (قدیمی‌تر از MESSAGE_ARCHIVE_AFTER_DAYS)
+    
+    روی PostgreSQL جدول بر اساس timestamp به پارتیشن‌های ماهانه تقسیم
+    می‌شود؛ پارتیشن‌ها هنگام بایگانی ساخته می‌شوند (app/archive.py).
+    """
+    __tablename__ = 'message_archive'
+    
+    # کلید پارتیشن باید جزو کلید اصلی باشد
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.DateTime, primary_key=True)
+    
+    __table_args__ = (
+        Index('idx_message_archive_conversation_live', 'user_lo_id', 'user_hi_id', 'timestamp', 'id', **_LIVE),
+        Index('idx_message_archive_unread', 'receiver_id', 'sender_id', 'id', **_UNREAD),
+        Index('idx_message_archive_conversation_seq', 'user_lo_id', 'user_hi_id', 'seq'),
+        Index('idx_message_archive_deleted', 'deleted_at', **_DELETED),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+
+# جدول‌های پیام به ترتیب خواندن (ابتدا پیام‌های اخیر)
+MESSAGE_MODELS = (Message, ArchivedMessage)
+
+
+class FileBlob(db.Model):
+    """فایل ذخیره شده بر اساس hash محتوا با شمارش ارجاع"""
+    __tablename__ = 'file_blob'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    # تعداد پیام‌هایی که به این فایل ارجاع می‌دهند
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    # ابعاد تصویر (فقط برای فایل‌های تصویری)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
     
     def __repr__(self):
-        return f'<Message from {self.sender_id} to {self.receiver_id}>'
+        return f'<FileBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+
+class Conversation(db.Model):
+    """خلاصه مکالمه بین دو کاربر (برای رندر سریع صندوق پیام)"""
+    __tablename__ = 'conversation'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # جفت کاربران همیشه به صورت (کوچکتر، بزرگتر) ذخیره می‌شود
+    user_lo_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_hi_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # بدون کلید خارجی: آخرین پیام ممکن است در message_archive باشد
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_message_preview = db.Column(db.String(200), nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    # تعداد پیام‌های خوانده نشده برای هر طرف
+    unread_lo = db.Column(db.Integer, nullable=False, default=0)
+    unread_hi = db.Column(db.Integer, nullable=False, default=0)
+    # آخرین پیام خوانده شده توسط هر طرف (watermark رسید خواندن)
+    last_read_lo_id = db.Column(db.Integer, nullable=False, default=0)
+    last_read_hi_id = db.Column(db.Integer, nullable=False, default=0)
+    # آخرین شماره رویداد مکالمه (هر ارسال، ویرایش یا حذف یک شماره می‌گیرد)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_lo_id', 'user_hi_id', name='uq_conversation_pair'),
+        Index('idx_conversation_lo_last', 'user_lo_id', 'last_message_at'),
+        Index('idx_conversation_hi_last', 'user_hi_id', 'last_message_at'),
+        Index('idx_conversation_last_message', 'last_message_id'),
+    )
+    
+    PREVIEW_LENGTH = 200
+    
+    @staticmethod
+    def pair(user_a, user_b):
+        """جفت مرتب شده کاربران"""
+        return min(user_a, user_b), max(user_a, user_b)
+    
+    @staticmethod
+    def room(user_a, user_b):
+        """نام اتاق Socket.IO مکالمه"""
+        return 'chat-{}-{}'.format(*Conversation.pair(user_a, user_b))
+    
+    @staticmethod
+    def messages_of(user_a, user_b, model=Message):
+        """شرط پیام‌های مکالمه روی کلید (user_lo_id، user_hi_id) در جدول model"""
+        user_lo_id, user_hi_id = Conversation.pair(user_a, user_b)
+        return and_(model.user_lo_id == user_lo_id, model.user_hi_id == user_hi_id)
+    
+    def other_user_id(self, user_id):
+        """شناسه طرف مقابل مکالمه"""
+        return self.user_hi_id if user_id == self.user_lo_id else self.user_lo_id
+    
+    def unread_count(self, user_id):
+        """تعداد پیام‌های خوانده نشده برای کاربر"""
+        return self.unread_lo if user_id == self.user_lo_id else self.unread_hi
+    
+    def last_read_id(self, user_id):
+        """آخرین پیامی که کاربر خوانده است"""
+        return self.last_read_lo_id if user_id == self.user_lo_id else self.last_read_hi_id
+    
+    def __repr__(self):
+        return f'<Conversation {self.user_lo_id}-{self.user_hi_id}>'
+
+
+class CacheVersion(db.Model):
+    """نسخه داده‌های صفحات cache شده (PageCache در app/services.py)"""
+    __tablename__ = 'cache_version'
+    
+    # inbox:<user_id> یا directory
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
 
 
 class PushSubscription(db.Model):
@@ -59,5 +274,16 @@ class PushSubscription(db.Model):
     auth = db.Column(db.String(500), nullable=False)
     created_at = db.Column(db.DateTime, server_default=func.now())
     
+    __table_args__ = (
+        Index('idx_push_subscription_user_endpoint', 'user_id', 'endpoint'),
+        Index('idx_push_subscription_endpoint', 'endpoint'),
+    )
+    
     def __repr__(self):
-        return f'<PushSubscription for user {self.user_id}>'
\ No newline at end of file
+        return f'<PushSubscription for user {self.user_id}>'
+
+
+@event.listens_for(Message, 'before_insert')
+def _set_conversation_key(mapper, connection, target):
+    """پر کردن کلید مکالمه برای هر پیام جدید"""
+    target.user_lo_id, target.user_hi_id = Conversation.pair(target.sender_id, target.receiver_id)
@@ -0,0 +1,66 @@
+"""
+Password Hashing
+hash و بررسی رمز عبور بدون مسدود کردن hub eventlet
+
+محاسبه hash (pbkdf2 یا scrypt) عمدا کند است. زیر eventlet همه سوکت‌های
+پروسه روی یک thread اجرا می‌شوند، پس محاسبه در thread pool واقعی
+(eventlet.tpool) انجام می‌شود؛ hashlib در حین محاسبه GIL را آزاد می‌کند.
+
+روش و هزینه با PASSWORD_HASH_METHOD تنظیم می‌شود و hash کاربرانی که با
+تنظیمات قبلی ساخته شده در اولین ورود موفق دوباره ساخته می‌شود.
+"""
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+def canonical_method(method):
+    """روش hash با تمام پارامترها، به همان شکلی که در ابتدای hash ذخیره می‌شود"""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if parts[0] == 'scrypt':
+        n, r, p = (parts[1:] + ['32768', '8', '1'][len(parts) - 1:])[:3]
+        return f'scrypt:{n}:{r}:{p}'
+    raise ValueError(f'Unsupported password hash method: {method}')
+
+
+class PasswordHasher:
+    """hash رمز عبور در thread pool با روش قابل تنظیم"""
+
+    method = canonical_method('pbkdf2:sha256:600000')
+    offload = True
+
+    @staticmethod
+    def init_app(app):
+        """خواندن روش hash و اندازه thread pool"""
+        PasswordHasher.method = canonical_method(app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'))
+        PasswordHasher.offload = app.config.get('PASSWORD_HASH_OFFLOAD', True)
+        if PasswordHasher.offload:
+            from eventlet import tpool
+            tpool.set_num_threads(app.config.get('PASSWORD_HASH_THREADS', 4))
+
+    @staticmethod
+    def _run(func, *args):
+        """اجرا در tpool وقتی eventlet فعال است، در غیر این صورت مستقیم"""
+        if PasswordHasher.offload:
+            from eventlet import patcher, tpool
+            if patcher.is_monkey_patched('thread'):
+                return tpool.execute(func, *args)
+        return func(*args)
+
+    @staticmethod
+    def hash(password):
+        """ساخت hash با روش فعلی"""
+        return PasswordHasher._run(generate_password_hash, password, PasswordHasher.method)
+
+    @staticmethod
+    def verify(password_hash, password):
+        """بررسی رمز عبور"""
+        return PasswordHasher._run(check_password_hash, password_hash, password)
+
+    @staticmethod
+    def needs_rehash(password_hash):
+        """آیا hash با روش یا هزینه‌ای غیر از تنظیمات فعلی ساخته شده است"""
+        return password_hash.split('$', 1)[0] != PasswordHasher.method
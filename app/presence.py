@@ -0,0 +1,148 @@
+"""
+Presence Backends
+ذخیره‌سازی وضعیت آنلاین کاربران
+
+هر اتصال (تب مرورگر) جداگانه با sid خودش ثبت می‌شود و کاربر تا زمانی
+آنلاین است که حداقل یک اتصال منقضی‌نشده داشته باشد.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MemoryPresenceBackend:
+    """ذخیره وضعیت آنلاین در حافظه همین پروسه (پیش‌فرض)"""
+
+    def __init__(self, ttl=90):
+        self.ttl = ttl
+        self._connections = {}  # user_id -> {sid: expires_at}
+        self._lock = threading.Lock()
+
+    def connect(self, user_id, sid):
+        """ثبت اتصال جدید"""
+        with self._lock:
+            self._connections.setdefault(user_id, {})[sid] = time.time() + self.ttl
+
+    def heartbeat(self, user_id, sid):
+        """تمدید اعتبار اتصال"""
+        self.connect(user_id, sid)
+
+    def disconnect(self, user_id, sid=None):
+        """حذف یک اتصال یا تمام اتصال‌های کاربر"""
+        with self._lock:
+            if sid is None:
+                self._connections.pop(user_id, None)
+                return
+
+            connections = self._connections.get(user_id)
+            if connections:
+                connections.pop(sid, None)
+                if not connections:
+                    del self._connections[user_id]
+
+    def connection_count(self, user_id):
+        """تعداد اتصال‌های فعال کاربر"""
+        now = time.time()
+        with self._lock:
+            connections = self._connections.get(user_id, {})
+            return sum(1 for expires_at in connections.values() if expires_at > now)
+
+    def online_many(self, user_ids):
+        """مجموعه کاربران آنلاین از بین user_ids"""
+        return {user_id for user_id in user_ids if self.connection_count(user_id) > 0}
+
+
+class SQLitePresenceBackend:
+    """ذخیره وضعیت آنلاین در یک فایل SQLite مشترک بین پروسه‌ها"""
+
+    def __init__(self, path, ttl=90):
+        self.path = path
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS presence ('
+                'sid TEXT PRIMARY KEY, '
+                'user_id INTEGER NOT NULL, '
+                'expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_presence_user ON presence (user_id, expires_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def connect(self, user_id, sid):
+        """ثبت اتصال جدید"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO presence (sid, user_id, expires_at) VALUES (?, ?, ?)',
+                (sid, user_id, time.time() + self.ttl)
+            )
+
+    def heartbeat(self, user_id, sid):
+        """تمدید اعتبار اتصال و پاکسازی اتصال‌های منقضی شده"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO presence (sid, user_id, expires_at) VALUES (?, ?, ?)',
+                (sid, user_id, now + self.ttl)
+            )
+            conn.execute('DELETE FROM presence WHERE expires_at <= ?', (now,))
+
+    def disconnect(self, user_id, sid=None):
+        """حذف یک اتصال یا تمام اتصال‌های کاربر"""
+        with self._connect() as conn:
+            if sid is None:
+                conn.execute('DELETE FROM presence WHERE user_id = ?', (user_id,))
+            else:
+                conn.execute('DELETE FROM presence WHERE sid = ?', (sid,))
+
+    def connection_count(self, user_id):
+        """تعداد اتصال‌های فعال کاربر"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT COUNT(*) FROM presence WHERE user_id = ? AND expires_at > ?',
+                (user_id, time.time())
+            ).fetchone()
+        return row[0]
+
+    def online_many(self, user_ids):
+        """مجموعه کاربران آنلاین از بین user_ids با یک کوئری"""
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return set()
+
+        placeholders = ','.join('?' * len(user_ids))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT DISTINCT user_id FROM presence '
+                f'WHERE expires_at > ? AND user_id IN ({placeholders})',
+                [time.time(), *user_ids]
+            ).fetchall()
+        return {row[0] for row in rows}
+
+
+def create_presence_backend(config):
+    """ساخت backend وضعیت آنلاین بر اساس تنظیمات"""
+    backend = config.get('PRESENCE_BACKEND', 'memory')
+    ttl = config.get('PRESENCE_TTL', 90)
+
+    if backend == 'memory':
+        return MemoryPresenceBackend(ttl=ttl)
+    if backend == 'sqlite':
+        return SQLitePresenceBackend(config['PRESENCE_DB_PATH'], ttl=ttl)
+
+    raise ValueError(f'Unknown presence backend: {backend}')
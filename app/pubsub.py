@@ -0,0 +1,105 @@
+"""
+Socket.IO Message Queue
+صف پیام مشترک Socket.IO بین چند پروسه
+
+بدون صف پیام، emit به یک اتاق فقط به کلاینت‌های متصل به همان پروسه
+می‌رسد. با SOCKETIO_MESSAGE_QUEUE تمام پروسه‌ها رویدادها را از طریق یک
+backend مشترک منتشر و دریافت می‌کنند:
+- redis://host:6379/0 (پیشنهادی برای production، چند سرور)
+- sqlite:///path/to/socketio.db (جایگزین محلی بدون Redis، فقط روی یک سرور)
+- هر URL دیگری که Flask-SocketIO پشتیبانی می‌کند (kafka://، zmq+tcp://، amqp://)
+"""
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from socketio import PubSubManager
+
+
+class SQLitePubSubManager(PubSubManager):
+    """صف پیام Socket.IO روی یک فایل SQLite مشترک (WAL)
+
+    هر پروسه پیام‌ها را در جدول می‌نویسد و پیام‌های جدید را با polling
+    روی کلید اصلی می‌خواند. پیام‌های قدیمی‌تر از retention حذف می‌شوند.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, channel='flask-socketio', write_only=False, logger=None,
+                 poll_interval=0.05, retention=60):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS socketio_message ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'channel TEXT NOT NULL, '
+                'payload TEXT NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _publish(self, data):
+        """انتشار یک پیام برای تمام پروسه‌ها"""
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO socketio_message (channel, payload, created_at) VALUES (?, ?, ?)',
+                (self.channel, json.dumps(data), time.time())
+            )
+
+    def _listen(self):
+        """دریافت پیام‌های جدید (از لحظه شروع پروسه)"""
+        with self._connect() as conn:
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_message').fetchone()[0]
+        last_cleanup = time.monotonic()
+
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT id, payload FROM socketio_message WHERE id > ? AND channel = ? ORDER BY id',
+                    (last_id, self.channel)
+                ).fetchall()
+
+                if time.monotonic() - last_cleanup > self.retention:
+                    conn.execute('DELETE FROM socketio_message WHERE created_at < ?',
+                                 (time.time() - self.retention,))
+                    last_cleanup = time.monotonic()
+
+            for message_id, payload in rows:
+                last_id = message_id
+                yield json.loads(payload)
+
+            if not rows:
+                time.sleep(self.poll_interval)
+
+
+def socketio_queue_options(config):
+    """پارامترهای socketio.init_app برای صف پیام تنظیم شده"""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if not url:
+        return {}
+
+    if url.startswith('sqlite:///'):
+        return {'client_manager': SQLitePubSubManager(url[len('sqlite:///'):], channel=channel)}
+
+    # redis://، kafka://، zmq و kombu توسط خود Flask-SocketIO ساخته می‌شوند
+    return {'message_queue': url, 'channel': channel}
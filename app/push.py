@@ -0,0 +1,207 @@
+"""
+Web Push Delivery Queue
+صف ارسال پس‌زمینه نوتیفیکیشن‌های Web Push
+
+ارسال نوتیفیکیشن دیگر در مسیر هندلر send_message انجام نمی‌شود:
+- پیام‌های پشت سر هم از یک فرستنده در پنجره coalesce به یک نوتیفیکیشن
+  «N پیام جدید» تبدیل می‌شوند.
+- ارسال به هر endpoint توسط تعداد محدودی worker انجام می‌شود و در صورت
+  خطای موقت با backoff نمایی دوباره تلاش می‌شود.
+- اشتراک‌های نامعتبر (404/410) جمع‌آوری و به صورت دسته‌ای حذف می‌شوند.
+"""
+
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from pywebpush import webpush, WebPushException
+from requests.exceptions import RequestException
+
+
+class PushDeliveryQueue:
+    """صف ارسال Web Push با worker pool محدود، retry و coalescing"""
+
+    def __init__(self, send=webpush):
+        self.send = send
+        self.app = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._timers = []  # heap of (due, seq, job)
+        self._seq = itertools.count()
+        self._pending = {}  # (user_id, sender_id) -> notification
+        self._dead_endpoints = set()
+        self._prune_scheduled = False
+        self._jobs = None
+
+    def init_app(self, app):
+        """خواندن تنظیمات (workerها در اولین ارسال شروع می‌شوند)"""
+        self.app = app
+        self.workers = app.config.get('PUSH_WORKERS', 4)
+        self.max_queue = app.config.get('PUSH_QUEUE_SIZE', 1000)
+        self.coalesce_window = app.config.get('PUSH_COALESCE_WINDOW', 3.0)
+        self.max_retries = app.config.get('PUSH_MAX_RETRIES', 4)
+        self.backoff_base = app.config.get('PUSH_BACKOFF_BASE', 2.0)
+        self.prune_delay = app.config.get('PUSH_PRUNE_DELAY', 5.0)
+
+    def _start(self):
+        """راه‌اندازی scheduler و workerها"""
+        if self._started:
+            return
+        self._started = True
+        self._jobs = queue.Queue(maxsize=self.max_queue)
+
+        threading.Thread(target=self._scheduler_loop, name='push-scheduler', daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker_loop, name=f'push-worker-{i}', daemon=True).start()
+
+    def enqueue(self, user_id, title, body, data=None, sender_id=None):
+        """اضافه کردن نوتیفیکیشن به صف (پیام‌های یک فرستنده coalesce می‌شوند)"""
+        key = (user_id, sender_id)
+        with self._condition:
+            self._start()
+            notification = self._pending.get(key)
+            if notification:
+                notification['count'] += 1
+                notification['body'] = body
+                return
+
+            self._pending[key] = {
+                'user_id': user_id,
+                'title': title,
+                'body': body,
+                'data': data or {},
+                'count': 1
+            }
+            self._schedule(self.coalesce_window, ('flush', key))
+
+    def _schedule(self, delay, job):
+        """زمان‌بندی یک job (باید با قفل صدا زده شود)"""
+        heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq), job))
+        self._condition.notify()
+
+    def _scheduler_loop(self):
+        """انتقال jobهای سررسید شده به صف workerها"""
+        while True:
+            with self._condition:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    timeout = self._timers[0][0] - time.monotonic() if self._timers else None
+                    self._condition.wait(timeout)
+                _, _, job = heapq.heappop(self._timers)
+
+            try:
+                self._jobs.put_nowait(job)
+            except queue.Full:
+                print(f"Push queue full, dropping job: {job[0]}")
+
+    def _worker_loop(self):
+        """اجرای jobها: flush، ارسال و حذف اشتراک‌های نامعتبر"""
+        while True:
+            job = self._jobs.get()
+            try:
+                with self.app.app_context():
+                    kind = job[0]
+                    if kind == 'flush':
+                        self._flush(job[1])
+                    elif kind == 'deliver':
+                        self._deliver(*job[1:])
+                    elif kind == 'prune':
+                        self._prune_dead_subscriptions()
+            except Exception as e:
+                print(f"Push job failed: {e}")
+            finally:
+                self._jobs.task_done()
+
+    def _flush(self, key):
+        """ساخت نوتیفیکیشن نهایی و ارسال به تمام اشتراک‌های کاربر"""
+        from app.models import PushSubscription
+
+        with self._condition:
+            notification = self._pending.pop(key, None)
+        if notification is None:
+            return
+
+        body = notification['body']
+        if notification['count'] > 1:
+            body = f"{notification['count']} پیام جدید"
+
+        payload = json.dumps({
+            'title': notification['title'],
+            'body': body,
+            'icon': '/static/images/logo.png',
+            'data': notification['data']
+        })
+
+        subscriptions = PushSubscription.query.filter_by(user_id=notification['user_id']).all()
+        for subscription in subscriptions:
+            subscription_info = {
+                'endpoint': subscription.endpoint,
+                'keys': {
+                    'p256dh': subscription.p256dh,
+                    'auth': subscription.auth
+                }
+            }
+            try:
+                self._jobs.put_nowait(('deliver', subscription_info, payload, 0))
+            except queue.Full:
+                print(f"Push queue full, dropping delivery to {subscription.endpoint}")
+
+    def _deliver(self, subscription_info, payload, attempt):
+        """ارسال به یک endpoint و retry با backoff نمایی در خطاهای موقت"""
+        try:
+            self.send(
+                subscription_info=subscription_info,
+                data=payload,
+                vapid_private_key=self.app.config['VAPID_PRIVATE_KEY'],
+                vapid_claims={
+                    "sub": self.app.config['VAPID_CLAIM_EMAIL']
+                }
+            )
+            return
+        except WebPushException as e:
+            status = e.response.status_code if e.response is not None else None
+            if status in (404, 410):
+                self._mark_dead(subscription_info['endpoint'])
+                return
+            if status is not None and status < 500 and status != 429:
+                print(f"Web Push failed: {e}")
+                return
+            error = e
+        except RequestException as e:
+            error = e
+
+        if attempt >= self.max_retries:
+            print(f"Web Push failed after {attempt + 1} attempts: {error}")
+            return
+
+        with self._condition:
+            self._schedule(
+                self.backoff_base * (2 ** attempt),
+                ('deliver', subscription_info, payload, attempt + 1)
+            )
+
+    def _mark_dead(self, endpoint):
+        """علامت‌گذاری اشتراک نامعتبر برای حذف دسته‌ای"""
+        with self._condition:
+            self._dead_endpoints.add(endpoint)
+            if not self._prune_scheduled:
+                self._prune_scheduled = True
+                self._schedule(self.prune_delay, ('prune',))
+
+    def _prune_dead_subscriptions(self):
+        """حذف دسته‌ای اشتراک‌های نامعتبر با یک کوئری"""
+        from app.extensions import db
+        from app.models import PushSubscription
+
+        with self._condition:
+            endpoints = list(self._dead_endpoints)
+            self._dead_endpoints.clear()
+            self._prune_scheduled = False
+
+        if endpoints:
+            PushSubscription.query.filter(
+                PushSubscription.endpoint.in_(endpoints)
+            ).delete(synchronize_session=False)
+            db.session.commit()
@@ -0,0 +1,89 @@
+"""
+Read Receipts
+ثبت دسته‌ای رسید خواندن پیام‌ها
+
+وضعیت خواندن هر مکالمه با یک watermark (شناسه آخرین پیام خوانده شده)
+نگهداری می‌شود. رویدادهای mark_read در حافظه جمع می‌شوند و هر
+READ_RECEIPT_FLUSH_INTERVAL ثانیه برای هر مکالمه فقط یک بار در دیتابیس
+ثبت می‌شوند؛ سپس رسید به فرستنده ارسال می‌شود.
+"""
+
+import threading
+import time
+
+
+def user_room(user_id):
+    """اتاق اختصاصی هر کاربر برای رویدادهایی که به صفحه چت وابسته نیستند"""
+    return f"user-{user_id}"
+
+
+class ReadReceiptBatcher:
+    """جمع‌آوری mark_read ها و ثبت دوره‌ای watermark ها"""
+
+    def __init__(self):
+        self.app = None
+        self._started = False
+        self._condition = threading.Condition()
+        self._pending = {}  # (reader_id, other_user_id) -> message_id
+
+    def init_app(self, app):
+        """خواندن تنظیمات (thread ثبت در اولین رویداد شروع می‌شود)"""
+        self.app = app
+        self.flush_interval = app.config.get('READ_RECEIPT_FLUSH_INTERVAL', 0.5)
+
+    def _start(self):
+        """راه‌اندازی thread ثبت دوره‌ای (باید با قفل صدا زده شود)"""
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._flush_loop, name='read-receipts', daemon=True).start()
+
+    def enqueue(self, reader_id, other_user_id, message_id):
+        """ثبت خوانده شدن پیام‌های مکالمه تا message_id (فقط بزرگترین شناسه نگه داشته می‌شود)"""
+        key = (reader_id, other_user_id)
+        with self._condition:
+            self._start()
+            if message_id > self._pending.get(key, 0):
+                self._pending[key] = message_id
+                self._condition.notify()
+
+    def _flush_loop(self):
+        """منتظر اولین رویداد، صبر به اندازه بازه ثبت و سپس ثبت دسته‌ای"""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            time.sleep(self.flush_interval)
+
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"Read receipt flush failed: {e}")
+
+    def flush(self):
+        """ثبت watermark های جمع شده و ارسال رسید به فرستنده‌ها"""
+        from app.extensions import socketio
+        from app.services import ChatService
+
+        with self._condition:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            receipts = ChatService.apply_read_watermarks(pending)
+        except Exception:
+            # برگرداندن رویدادها برای تلاش در دور بعد
+            with self._condition:
+                for key, message_id in pending.items():
+                    if message_id > self._pending.get(key, 0):
+                        self._pending[key] = message_id
+            raise
+
+        for reader_id, sender_id, last_read_id in receipts:
+            socketio.emit('messages_read', {
+                'reader_id': reader_id,
+                'last_read_id': last_read_id
+            }, room=user_room(sender_id))
+        return len(receipts)
@@ -3,10 +3,12 @@ Chat Routes
 مسیرهای چت و پیام‌رسانی
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, send_from_directory
+import mimetypes
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, send_file, abort, current_app
 from werkzeug.utils import secure_filename
 from app.models import User
-from app.services import ChatService, StateManager, FileService, NotificationService
+from app.services import ChatService, StateManager, FileService, NotificationService, UserLoader, ChunkedUploadService, UserDirectory, PageCache
+from app.extensions import limiter
 from app.decorators import login_required
 
 chat_bp = Blueprint('chat', __name__)
@@ -15,18 +17,53 @@ chat_bp = Blueprint('chat', __name__)
 @chat_bp.route('/match')
 @login_required
 def match():
-    """صفحه جستجوی کاربران"""
+    """صفحه جستجوی کاربران (صفحه‌بندی شده با after_id)"""
     current_user_id = session['current_user_id']
     q = request.args.get('q', '')
+    major = request.args.get('major') or None
+    after_id = request.args.get('after_id', type=int)
     
-    query = User.query.filter(User.id != current_user_id)
+    # نتایج فقط با تغییر فهرست کاربران (ثبت‌نام، تغییر پروفایل، حذف حساب) عوض می‌شوند
+    key = ('match', current_user_id, q, major, after_id, PageCache.versions(PageCache.DIRECTORY))
     
-    if q:
-        users = query.filter((User.major.contains(q)) | (User.name.contains(q))).all()
-    else:
-        users = query.all()
+    def results():
+        users, has_more = UserDirectory.search(current_user_id, q, major=major, after_id=after_id)
+        return dict(users=users, selected_major=major, next_after_id=users[-1].id if has_more else None)
+    
+    def render_page():
+        results_html = PageCache.fragment(key, 'fragments/match_results.html', results)
+        return render_template('match.html',
+                               results_html=results_html,
+                               majors=UserDirectory.major_counts(),
+                               selected_major=major)
     
-    return render_template('match.html', users=users)
+    return PageCache.respond(key, render_page)
+
+
+@chat_bp.route('/api/users/search')
+@login_required
+@limiter.limit("120 per minute")
+def typeahead_users():
+    """پیشنهاد کاربران هنگام تایپ در جستجو"""
+    users = UserDirectory.typeahead(
+        session['current_user_id'],
+        request.args.get('q', ''),
+        limit=request.args.get('limit', type=int)
+    )
+    
+    response = jsonify({'results': [
+        {
+            'id': user.id,
+            'name': user.name,
+            'major': user.major,
+            'chat_url': url_for('chat.chat', other_user_id=user.id)
+        }
+        for user in users
+    ]})
+    # درخواست‌های تکراری هنگام تایپ/پاک کردن از cache مرورگر پاسخ داده می‌شوند
+    response.cache_control.private = True
+    response.cache_control.max_age = 30
+    return response
 
 
 @chat_bp.route('/chat/<int:other_user_id>')
@@ -39,9 +76,37 @@ def chat(other_user_id):
         return redirect(url_for('chat.inbox'))
     
     other_user = User.query.get_or_404(other_user_id)
+    # قبل از خواندن پیام‌ها تا تغییرات همزمان با رندر صفحه در sync دریافت شوند
+    last_seq = ChatService.get_last_seq(current_user_id, other_user_id)
     messages = ChatService.get_chat_history(current_user_id, other_user_id)
+    has_more = len(messages) >= ChatService.HISTORY_PAGE_SIZE
+    
+    return render_template('chat.html', other_user=other_user, messages=messages, has_more=has_more,
+                           last_seq=last_seq)
+
+
+@chat_bp.route('/api/chat/<int:other_user_id>/messages')
+@login_required
+def chat_messages(other_user_id):
+    """API صفحه‌بندی تاریخچه چت (before_id / after_id)"""
+    current_user_id = session['current_user_id']
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', ChatService.HISTORY_PAGE_SIZE, type=int)
+    
+    if before_id and after_id:
+        return jsonify({'success': False, 'error': 'Use either before_id or after_id'}), 400
+    
+    messages, has_more = ChatService.get_messages_page(
+        current_user_id, other_user_id,
+        before_id=before_id, after_id=after_id, limit=limit
+    )
     
-    return render_template('chat.html', other_user=other_user, messages=messages)
+    return jsonify({
+        'success': True,
+        'messages': [msg.to_dict() for msg in messages],
+        'has_more': has_more
+    })
 
 
 @chat_bp.route('/inbox')
@@ -49,9 +114,23 @@ def chat(other_user_id):
 def inbox():
     """صفحه صندوق پیام‌ها"""
     current_user_id = session['current_user_id']
-    conversations = ChatService.get_inbox_conversations(current_user_id)
+    # نام طرف مقابل از فهرست کاربران می‌آید؛ نسخه آن هم جزو کلید است
+    versions = PageCache.versions(PageCache.inbox(current_user_id), PageCache.DIRECTORY)
+    conversations = PageCache.cached(('inbox', current_user_id, versions),
+                                     lambda: ChatService.get_inbox_conversations(current_user_id))
+    
+    # وضعیت آنلاین نسخه ندارد؛ در هر درخواست خوانده و جزو کلید HTML و ETag می‌شود
+    online_ids = StateManager.is_online_many([conversation['other_user_id'] for conversation in conversations])
+    online = tuple(conversation['other_user_id'] in online_ids for conversation in conversations)
+    key = ('inbox', current_user_id, versions, online)
+    
+    def render_page():
+        conversations_html = PageCache.fragment(key, 'fragments/inbox_conversations.html', lambda: dict(conversations=[
+            dict(conversation, is_online=is_online) for conversation, is_online in zip(conversations, online)
+        ]))
+        return render_template('inbox.html', conversations_html=conversations_html, user_id=current_user_id)
     
-    return render_template('inbox.html', conversations=conversations, user_id=current_user_id)
+    return PageCache.respond(key, render_page)
 
 
 @chat_bp.route('/api/user_status/<int:user_id>')
@@ -66,28 +145,29 @@ def search_messages():
     """جستجو در پیام‌ها"""
     current_user_id = session['current_user_id']
     query = request.json.get('query', '')
+    cursor = request.json.get('cursor')
     
     if len(query) < 2:
-        return jsonify({'results': []})
+        return jsonify({'results': [], 'next_cursor': None})
     
-    messages = ChatService.search_messages(current_user_id, query)
+    messages, next_cursor = ChatService.search_messages(current_user_id, query, cursor=cursor)
+    
+    # بارگذاری تمام کاربران نتایج با یک کوئری
+    users = UserLoader.get_many({user_id for msg in messages for user_id in (msg.sender_id, msg.receiver_id)})
     
     results = []
     for msg in messages:
-        sender = User.query.get(msg.sender_id)
-        receiver = User.query.get(msg.receiver_id)
-        
         results.append({
             'id': msg.id,
             'content': msg.content,
-            'sender_name': sender.name,
-            'receiver_name': receiver.name,
+            'sender_name': users[msg.sender_id].name,
+            'receiver_name': users[msg.receiver_id].name,
             'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M'),
             'chat_link': url_for('chat.chat', 
                                 other_user_id=msg.receiver_id if msg.sender_id == current_user_id else msg.sender_id)
         })
     
-    return jsonify({'results': results})
+    return jsonify({'results': results, 'next_cursor': next_cursor})
 
 
 @chat_bp.route('/api/edit_message', methods=['POST'])
@@ -129,12 +209,58 @@ def subscribe_push():
     return jsonify({'success': True})
 
 
-@chat_bp.route('/uploads/<filename>')
+@chat_bp.route('/uploads/<path:filename>')
 @login_required
 def uploaded_file(filename):
-    """دانلود فایل آپلود شده"""
-    from config import Config
-    return send_from_directory(Config.UPLOAD_FOLDER, filename)
+    """دانلود فایل آپلود شده (Range، ETag و درخواست شرطی)"""
+    download = FileService.resolve_download(session['current_user_id'], filename)
+    if not download:
+        abort(404)
+    
+    file_path, sha256 = download
+    
+    # X-Accel-Redirect: احراز دسترسی در برنامه، ارسال بایت‌ها توسط nginx
+    if current_app.config.get('DOWNLOAD_OFFLOAD') == 'x-accel':
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = current_app.config['DOWNLOAD_ACCEL_PREFIX'] + filename
+        if sha256:
+            response.set_etag(sha256)
+        response.make_conditional(request)
+    else:
+        # send_file خودش Range، If-None-Match و X-Sendfile (USE_X_SENDFILE) را مدیریت می‌کند
+        response = send_file(file_path, conditional=True, etag=sha256 or True)
+    
+    # فایل‌های hash شده هرگز تغییر نمی‌کنند
+    if sha256:
+        response.cache_control.no_cache = None
+        response.cache_control.private = True
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    
+    return response
+
+
+@chat_bp.route('/thumbnails/<sha256>/<size>')
+@login_required
+def thumbnail(sha256, size):
+    """پیش‌نمایش تصویر (WebP در صورت پشتیبانی مرورگر، در غیر این صورت JPEG)"""
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    path = FileService.resolve_thumbnail(session['current_user_id'], sha256, size, fmt)
+    if not path:
+        abort(404)
+    
+    response = send_file(path, conditional=True, etag=f'{sha256}-{size}-{fmt}')
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
 # اضافه کنید به انتهای فایل app/routes/chat.py
 
 @chat_bp.route('/api/send_message_with_file', methods=['POST'])
@@ -157,14 +283,83 @@ def send_message_with_file():
     
     # ذخیره پیام در دیتابیس
     msg = ChatService.save_message(current_user_id, other_user_id, content, file_info)
+    if not msg:
+        return jsonify({'success': False, 'error': 'File expired'}), 410
     
     return jsonify({
         'success': True,
         'message_id': msg.id,
-        'file_info': {
+        'file_info': msg.file_info
+    })
+
+
+@chat_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def init_upload():
+    """شروع آپلود تکه‌ای"""
+    current_user_id = session['current_user_id']
+    upload = ChunkedUploadService.init_upload(
+        current_user_id,
+        request.json.get('file_name'),
+        request.json.get('file_size')
+    )
+    
+    if not upload:
+        return jsonify({'success': False, 'error': 'Invalid file'}), 400
+    
+    return jsonify({'success': True, **upload})
+
+
+@chat_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    """وضعیت آپلود برای ادامه بعد از قطع اتصال"""
+    meta = ChunkedUploadService.get_upload(upload_id, session['current_user_id'])
+    if not meta:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    return jsonify({'success': True, 'offset': meta['received'], 'file_size': meta['file_size']})
+
+
+@chat_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """دریافت یک تکه فایل (بدنه خام درخواست، offset در query string)"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': 'Missing offset'}), 400
+    
+    received = ChunkedUploadService.write_chunk(upload_id, session['current_user_id'], offset, request.stream)
+    if received is None:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    return jsonify({'success': True, 'offset': received})
+
+
+@chat_bp.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """اتمام آپلود و در صورت وجود گیرنده، ارسال پیام همراه با فایل"""
+    current_user_id = session['current_user_id']
+    file_info = ChunkedUploadService.finalize_upload(upload_id, current_user_id)
+    if not file_info:
+        return jsonify({'success': False, 'error': 'Upload incomplete'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    other_user_id = data.get('other_user_id')
+    msg = None
+    if other_user_id:
+        msg = ChatService.save_message(current_user_id, other_user_id, data.get('content') or 'فایل ارسال شد', file_info)
+        if not msg:
+            return jsonify({'success': False, 'error': 'File expired'}), 410
+    
+    return jsonify({
+        'success': True,
+        'message_id': msg.id if msg else None,
+        'file_info': msg.file_info if msg else {
             'name': file_info['file_name'],
             'type': file_info['file_type'],
             'size': file_info['file_size'],
-            'url': f"/uploads/{file_info['relative_path'].split('/')[-1]}"
-        } if file_info else None
+            'url': f"/{file_info['relative_path']}"
+        }
     })
\ No newline at end of file
@@ -4,29 +4,50 @@ SocketIO Event Handlers
 """
 
 from flask import session, request
-from flask_socketio import emit, join_room
-from app.models import User
-from app.services import ChatService, StateManager, FileService, NotificationService
+from flask_socketio import emit, join_room, rooms
+from app.extensions import read_receipts, message_writer, metrics, typing_tracker
+from app.decorators import socket_rate_limit
+from app.receipts import user_room
+from app.typing_indicator import chat_room_members
+from app.models import Conversation
+from app.services import ChatService, StateManager, FileService, NotificationService, ProfileCache
 
 
 def register_socketio_handlers(socketio):
     """ثبت تمام event handler های SocketIO"""
     
-    @socketio.on('connect')
+    # socketio.on با اندازه‌گیری زمان و کوئری‌ها (در صورت فعال بودن METRICS_ENABLED)
+    on = metrics.socket_handler(socketio)
+    
+    @on('connect')
     def handle_connect():
         """هنگام اتصال کاربر"""
         current_user_id = session.get('current_user_id')
         if current_user_id:
-            StateManager.set_online(current_user_id)
+            StateManager.set_online(current_user_id, request.sid)
+            # اتاق شخصی کاربر برای دریافت رسید خواندن
+            join_room(user_room(current_user_id))
     
-    @socketio.on('disconnect')
+    @on('disconnect')
     def handle_disconnect():
         """هنگام قطع اتصال کاربر"""
         current_user_id = session.get('current_user_id')
         if current_user_id:
-            StateManager.set_offline(current_user_id)
+            StateManager.set_offline(current_user_id, request.sid)
+        
+        # پایان تایپ در اتاق‌هایی که stop_typing آن‌ها نرسیده
+        for user_id, room in typing_tracker.disconnect(request.sid):
+            emit('stop_typing', {'user_id': user_id}, room=room, include_self=False)
+    
+    @on('heartbeat')
+    def handle_heartbeat():
+        """تمدید وضعیت آنلاین (اتصال‌های قطع شده بعد از TTL منقضی می‌شوند)"""
+        current_user_id = session.get('current_user_id')
+        if current_user_id:
+            StateManager.heartbeat(current_user_id, request.sid)
     
-    @socketio.on('join_chat')
+    @on('join_chat')
+    @socket_rate_limit("60 per minute")
     def handle_join_chat(data):
         """ورود به اتاق چت"""
         current_user_id = session.get('current_user_id')
@@ -34,16 +55,69 @@ def register_socketio_handlers(socketio):
             return
         
         other_user_id = data['other_user_id']
-        room_id = f"chat-{min(current_user_id, other_user_id)}-{max(current_user_id, other_user_id)}"
+        room_id = Conversation.room(current_user_id, other_user_id)
         join_room(room_id)
         
-        user = User.query.get(current_user_id)
+        user = ProfileCache.get(current_user_id)
         emit('status_message', 
              {'msg': f"{user.name} متصل شد.", 'type': 'join'}, 
              room=room_id, 
              include_self=False)
     
-    @socketio.on('send_message')
+    @on('load_older')
+    @socket_rate_limit("60 per minute")
+    def handle_load_older(data):
+        """دریافت صفحه قدیمی‌تر تاریخچه چت"""
+        current_user_id = session.get('current_user_id')
+        if not current_user_id:
+            return
+        
+        other_user_id = data.get('other_user_id')
+        before_id = data.get('before_id')
+        if not other_user_id or not before_id:
+            return
+        
+        messages, has_more = ChatService.get_messages_page(
+            current_user_id, other_user_id, before_id=before_id
+        )
+        
+        emit('older_messages', {
+            'other_user_id': other_user_id,
+            'messages': [msg.to_dict() for msg in messages],
+            'has_more': has_more
+        })
+    
+    @on('sync')
+    @socket_rate_limit("60 per minute")
+    def handle_sync(data):
+        """تغییرات مکالمه بعد از since_seq برای کلاینتی که دوباره متصل شده (پاسخ در ack)"""
+        current_user_id = session.get('current_user_id')
+        if not current_user_id:
+            return
+        
+        other_user_id = data.get('other_user_id')
+        since_seq = data.get('since_seq')
+        if not isinstance(other_user_id, int) or not isinstance(since_seq, int):
+            return
+        
+        messages, has_more = ChatService.get_sync_events(current_user_id, other_user_id, since_seq)
+        
+        events = []
+        for msg in messages:
+            if msg.is_deleted:
+                events.append({'seq': msg.seq, 'message_id': msg.id, 'deleted': True})
+            else:
+                events.append({**msg.to_dict(), 'deleted': False})
+        
+        return {
+            'other_user_id': other_user_id,
+            'events': events,
+            'last_seq': messages[-1].seq if messages else since_seq,
+            'has_more': has_more
+        }
+    
+    @on('send_message')
+    @socket_rate_limit("20 per 10 seconds")
     def handle_send_message(data):
         """ارسال پیام"""
         current_user_id = session.get('current_user_id')
@@ -52,45 +126,83 @@ def register_socketio_handlers(socketio):
         
         other_user_id = data.get('other_user_id')
         content = data.get('content')
-        file_info = data.get('file_info')
         
-        if not other_user_id or not content:
+        # شناسه کلاینت برای ارسال مجدد بدون تکرار
+        client_id = data.get('client_id')
+        if not isinstance(client_id, str) or not 0 < len(client_id) <= 36:
+            client_id = None
+        
+        if not other_user_id:
             return
         
-        msg = ChatService.save_message(current_user_id, other_user_id, content, file_info)
-        room_id = f"chat-{min(current_user_id, other_user_id)}-{max(current_user_id, other_user_id)}"
+        if data.get('message_id'):
+            # پیام همراه فایل قبلا از طریق API آپلود ذخیره شده و فقط منتشر می‌شود
+            msg = ChatService.get_sent_message(data['message_id'], current_user_id, other_user_id)
+            if not msg:
+                return
+            content = msg.content
+        elif content and message_writer.enabled:
+            # write-behind: انتشار فوری، ذخیره دسته‌ای و تایید با رویداد message_persisted
+            msg = message_writer.enqueue(current_user_id, other_user_id, content, client_id)
+        elif content:
+            # اطلاعات فایل فقط از طریق API آپلود ثبت می‌شود، نه از داده کلاینت
+            msg = ChatService.save_message(current_user_id, other_user_id, content, client_id=client_id)
+        else:
+            return
+        
+        room_id = Conversation.room(current_user_id, other_user_id)
         
-        user = User.query.get(current_user_id)
+        user = ProfileCache.get(current_user_id)
+        message_id = getattr(msg, 'id', None)
         
         message_data = {
             'sender_name': user.name,
             'content': content,
             'timestamp': msg.timestamp.strftime('%H:%M'),
             'sender_id': current_user_id,
-            'message_id': msg.id
+            'message_id': message_id,
+            'client_id': msg.client_id,
+            'seq': getattr(msg, 'seq', None)
         }
         
-        # اضافه کردن اطلاعات فایل
-        if msg.file_path:
-            message_data['file'] = {
-                'name': msg.file_name,
-                'type': msg.file_type,
-                'size': msg.file_size,
-                'url': f'/uploads/{msg.file_path.split("/")[-1]}'
-            }
+        # اضافه کردن اطلاعات فایل (همراه با آدرس و ابعاد پیش‌نمایش تصاویر)
+        if message_id and msg.file_path:
+            message_data['file'] = msg.file_info
         
         emit('new_message', message_data, room=room_id, include_self=False)
+        # گیرنده با رسیدن پیام نشانگر تایپ را پنهان می‌کند؛ فقط وضعیت سرور پاک می‌شود
+        typing_tracker.stop(current_user_id, room_id)
         
         # ارسال نوتیفیکیشن به گیرنده
         if not StateManager.is_online(other_user_id):
-            NotificationService.send_notification(
+            NotificationService.queue_notification(
                 other_user_id,
                 f'پیام جدید از {user.name}',
                 content[:50] + ('...' if len(content) > 50 else ''),
-                {'url': f'/chat/{current_user_id}'}
+                {'url': f'/chat/{current_user_id}'},
+                sender_id=current_user_id
             )
+        
+        # ack: شناسه پیام ذخیره شده، یا در حالت write-behind فقط client_id تا رسیدن message_persisted
+        return {'message_id': message_id, 'client_id': msg.client_id, 'seq': message_data['seq']}
     
-    @socketio.on('edit_message')
+    @on('mark_read')
+    @socket_rate_limit("120 per minute")
+    def handle_mark_read(data):
+        """خوانده شدن پیام‌های مکالمه تا message_id (به صورت دسته‌ای ثبت می‌شود)"""
+        current_user_id = session.get('current_user_id')
+        if not current_user_id:
+            return
+        
+        other_user_id = data.get('other_user_id')
+        message_id = data.get('message_id')
+        if not isinstance(other_user_id, int) or not isinstance(message_id, int):
+            return
+        
+        read_receipts.enqueue(current_user_id, other_user_id, message_id)
+    
+    @on('edit_message')
+    @socket_rate_limit("30 per minute")
     def handle_edit_message(data):
         """ویرایش پیام"""
         current_user_id = session.get('current_user_id')
@@ -99,16 +211,18 @@ def register_socketio_handlers(socketio):
         
         message_id = data.get('message_id')
         new_content = data.get('content')
-        other_user_id = data.get('other_user_id')
         
-        if ChatService.edit_message(message_id, new_content, current_user_id):
-            room_id = f"chat-{min(current_user_id, other_user_id)}-{max(current_user_id, other_user_id)}"
+        msg = ChatService.edit_message(message_id, new_content, current_user_id)
+        if msg:
+            # اتاق از کلید مکالمه خود پیام، نه شناسه ارسالی کلاینت
             emit('message_edited', {
                 'message_id': message_id,
-                'new_content': new_content
-            }, room=room_id)
+                'new_content': new_content,
+                'seq': msg.seq
+            }, room=msg.room)
     
-    @socketio.on('delete_message')
+    @on('delete_message')
+    @socket_rate_limit("30 per minute")
     def handle_delete_message(data):
         """حذف پیام"""
         current_user_id = session.get('current_user_id')
@@ -116,30 +230,45 @@ def register_socketio_handlers(socketio):
             return
         
         message_id = data.get('message_id')
-        other_user_id = data.get('other_user_id')
         
-        if ChatService.delete_message(message_id, current_user_id):
-            room_id = f"chat-{min(current_user_id, other_user_id)}-{max(current_user_id, other_user_id)}"
+        msg = ChatService.delete_message(message_id, current_user_id)
+        if msg:
+            # اتاق از کلید مکالمه خود پیام، نه شناسه ارسالی کلاینت
             emit('message_deleted', {
-                'message_id': message_id
-            }, room=room_id)
+                'message_id': message_id,
+                'seq': msg.seq
+            }, room=msg.room)
     
-    @socketio.on('typing')
-    def handle_typing(data):
-        """در حال تایپ"""
+    def typing_room(data):
+        """اتاق چت معتبری که کاربر جاری عضو آن است، یا None"""
         current_user_id = session.get('current_user_id')
-        if current_user_id and data.get('room'):
+        room = data.get('room') if isinstance(data, dict) else None
+        members = chat_room_members(room)
+        if not current_user_id or not members or current_user_id not in members:
+            return None
+        # فقط اتاقی که این اتصال با join_chat وارد آن شده
+        if room not in rooms():
+            return None
+        return room
+    
+    @on('typing')
+    @socket_rate_limit("60 per minute")
+    def handle_typing(data):
+        """در حال تایپ (فقط شروع تایپ به اتاق ارسال می‌شود)"""
+        room = typing_room(data)
+        if room and typing_tracker.start(session['current_user_id'], room, request.sid):
             emit('typing', 
-                 {'user_id': current_user_id}, 
-                 room=data['room'], 
+                 {'user_id': session['current_user_id']}, 
+                 room=room, 
                  include_self=False)
     
-    @socketio.on('stop_typing')
+    @on('stop_typing')
+    @socket_rate_limit("60 per minute")
     def handle_stop_typing(data):
         """توقف تایپ"""
-        current_user_id = session.get('current_user_id')
-        if current_user_id and data.get('room'):
+        room = typing_room(data)
+        if room and typing_tracker.stop(session['current_user_id'], room):
             emit('stop_typing', 
-                 {'user_id': current_user_id}, 
-                 room=data['room'], 
-                 include_self=False)
\ No newline at end of file
+                 {'user_id': session['current_user_id']}, 
+                 room=room, 
+                 include_self=False)
@@ -4,11 +4,11 @@ User Routes
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
+from markupsafe import Markup
 from app.models import User
 from app.forms import UpdateProfileForm, UpdatePasswordForm, DeleteAccountForm
 from app.decorators import login_required
-from app.services import StateManager
+from app.services import StateManager, ProfileCache, UserDirectory, AuthService, PageCache
 from app.extensions import db
 
 user_bp = Blueprint('user', __name__)
@@ -19,9 +19,21 @@ user_bp = Blueprint('user', __name__)
 def profile(user_id):
     """نمایش پروفایل کاربر"""
     current_user_id = session['current_user_id']
-    user = User.query.get_or_404(user_id)
     can_edit = (current_user_id == user_id)
     
+    if not can_edit:
+        # پروفایل دیگران فقط با تغییر فهرست کاربران عوض می‌شود
+        key = ('profile', user_id, PageCache.versions(PageCache.DIRECTORY))
+        
+        def render_page():
+            profile_html = PageCache.fragment(key, 'fragments/profile_card.html',
+                                              lambda: dict(user=User.query.get_or_404(user_id), can_edit=False))
+            return render_template('profile.html', profile_html=profile_html, user_id=user_id, can_edit=False)
+        
+        return PageCache.respond(key, render_page)
+    
+    # پروفایل خود کاربر فرم‌های دارای توکن CSRF دارد و cache نمی‌شود
+    user = User.query.get_or_404(user_id)
     forms = {
         'update_profile': UpdateProfileForm(obj=user, original_username=user.name) if can_edit else None,
         'update_password': UpdatePasswordForm() if can_edit else None,
@@ -29,7 +41,8 @@ def profile(user_id):
     }
     
     return render_template('profile.html', 
-                           user=user, 
+                           profile_html=Markup(render_template('fragments/profile_card.html', user=user, can_edit=True)),
+                           user_id=user_id,
                            can_edit=can_edit,
                            update_profile_form=forms['update_profile'],
                            update_password_form=forms['update_password'],
@@ -47,7 +60,10 @@ def update_profile():
     if form.validate_on_submit():
         user.name = form.name.data
         user.major = form.major.data
+        PageCache.bump(PageCache.DIRECTORY)
         db.session.commit()
+        ProfileCache.invalidate(user_id)
+        UserDirectory.invalidate_facets()
         flash('پروفایل بروزرسانی شد.', 'success')
     
     return redirect(url_for('user.profile', user_id=user_id))
@@ -62,9 +78,7 @@ def update_password():
     form = UpdatePasswordForm()
     
     if form.validate_on_submit():
-        if check_password_hash(user.password_hash, form.current_password.data):
-            user.password_hash = generate_password_hash(form.new_password.data, method='pbkdf2:sha256')
-            db.session.commit()
+        if AuthService.update_password(user, form.current_password.data, form.new_password.data):
             flash('رمز عبور تغییر کرد.', 'success')
         else:
             flash('رمز عبور فعلی اشتباه است.', 'error')
@@ -81,7 +95,10 @@ def delete_account():
     
     StateManager.set_offline(user_id)
     db.session.delete(user)
+    PageCache.bump(PageCache.DIRECTORY)
     db.session.commit()
+    ProfileCache.invalidate(user_id)
+    UserDirectory.invalidate_facets()
     session.clear()
     
     flash('حساب کاربری حذف شد.', 'info')
@@ -98,5 +115,6 @@ def toggle_theme():
     # تغییر تم
     user.theme = 'dark' if user.theme == 'light' else 'light'
     db.session.commit()
+    ProfileCache.invalidate(user_id)
     
     return jsonify({'success': True, 'theme': user.theme})
\ No newline at end of file
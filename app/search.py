@@ -0,0 +1,219 @@
+"""
+Message Search Index
+ایندکس جستجوی متن کامل پیام‌ها و نام کاربران
+
+روی PostgreSQL از tsvector با ایندکس GIN و روی SQLite از جدول مجازی FTS5
+استفاده می‌شود. متن پیام قبل از ایندکس شدن نرمال‌سازی می‌شود تا تفاوت
+ی/ي، ک/ك، نیم‌فاصله و اعراب در نتیجه جستجو اثری نداشته باشد.
+"""
+
+import re
+from sqlalchemy import DDL, Float, cast, event, text, func, literal_column, or_, and_
+from app.extensions import db
+from app.models import Message, ArchivedMessage, MESSAGE_MODELS, User
+
+# نگاشت حروف عربی به معادل فارسی و حذف کاراکترهای کنترلی
+_CHAR_MAP = str.maketrans({
+    '\u064a': '\u06cc',  # ي -> ی
+    '\u0649': '\u06cc',  # ى -> ی
+    '\u0643': '\u06a9',  # ك -> ک
+    '\u0629': '\u0647',  # ة -> ه
+    '\u06c0': '\u0647',  # ۀ -> ه
+    '\u0623': '\u0627',  # أ -> ا
+    '\u0625': '\u0627',  # إ -> ا
+    '\u0671': '\u0627',  # ٱ -> ا
+    '\u200c': ' ',       # نیم‌فاصله (ZWNJ)
+    '\u200d': None,      # ZWJ
+    '\u200e': None,      # LRM
+    '\u200f': None,      # RLM
+    '\u0640': None,      # کشیده
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+
+# اعراب و علائم تشکیل
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+
+_TOKEN = re.compile(r'\w+')
+
+_TS_CONFIG = literal_column("'simple'::regconfig")
+
+# ساخت ساختارهای ایندکس همراه با جدول message (db.create_all و مایگریشن)
+event.listen(
+    Message.__table__, 'after_create',
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(search_text, tokenize='unicode61')")
+    .execute_if(dialect='sqlite')
+)
+event.listen(
+    Message.__table__, 'after_create',
+    DDL("CREATE INDEX IF NOT EXISTS idx_message_search ON message "
+        "USING gin (to_tsvector('simple'::regconfig, search_text))")
+    .execute_if(dialect='postgresql')
+)
+# پیام‌های بایگانی شده: روی SQLite ردیف message_fts با همان شناسه باقی می‌ماند
+event.listen(
+    ArchivedMessage.__table__, 'after_create',
+    DDL("CREATE INDEX IF NOT EXISTS idx_message_archive_search ON message_archive "
+        "USING gin (to_tsvector('simple'::regconfig, search_text))")
+    .execute_if(dialect='postgresql')
+)
+
+# جستجوی زیررشته در نام کاربران (LIKE '%...%') روی PostgreSQL با ایندکس trigram
+event.listen(
+    User.__table__, 'after_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')
+)
+event.listen(
+    User.__table__, 'after_create',
+    DDL('CREATE INDEX IF NOT EXISTS idx_user_search_name_trgm ON "user" '
+        'USING gin (search_name gin_trgm_ops)')
+    .execute_if(dialect='postgresql')
+)
+
+
+@event.listens_for(User.name, 'set')
+def _update_search_name(user, value, oldvalue, initiator):
+    """نگه داشتن نام نرمال شده همگام با نام کاربر"""
+    user.search_name = normalize_text(value)
+
+
+def normalize_text(value):
+    """نرمال‌سازی متن فارسی برای ایندکس و جستجو"""
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value.translate(_CHAR_MAP))
+    return ' '.join(value.lower().split())
+
+
+def tokenize(value):
+    """تبدیل متن به توکن‌های قابل جستجو"""
+    return _TOKEN.findall(normalize_text(value))
+
+
+class SearchIndex:
+    """مدیریت ایندکس جستجوی پیام‌ها"""
+
+    @staticmethod
+    def _dialect():
+        return db.session.get_bind().dialect.name
+
+    @staticmethod
+    def index_message(msg):
+        """ایندکس کردن پیام جدید یا ویرایش شده (پیام باید flush شده باشد)"""
+        msg.search_text = normalize_text(msg.content)
+
+        if SearchIndex._dialect() == 'sqlite':
+            db.session.execute(text('DELETE FROM message_fts WHERE rowid = :id'), {'id': msg.id})
+            db.session.execute(
+                text('INSERT INTO message_fts (rowid, search_text) VALUES (:id, :search_text)'),
+                {'id': msg.id, 'search_text': msg.search_text}
+            )
+
+    @staticmethod
+    def remove_message(msg):
+        """حذف پیام از ایندکس"""
+        msg.search_text = None
+
+        if SearchIndex._dialect() == 'sqlite':
+            db.session.execute(text('DELETE FROM message_fts WHERE rowid = :id'), {'id': msg.id})
+
+    @staticmethod
+    def encode_cursor(score, message_id):
+        """ساخت cursor صفحه بعد از (امتیاز، شناسه) آخرین نتیجه"""
+        return f'{score!r}:{message_id}'
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """خواندن cursor - در صورت نامعتبر بودن None"""
+        try:
+            score, message_id = cursor.rsplit(':', 1)
+            return float(score), int(message_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def search(user_id, query, cursor=None, limit=50):
+        """جستجوی رتبه‌بندی شده در پیام‌های کاربر - (پیام‌ها، cursor بعدی)"""
+        tokens = tokenize(query)
+        if not tokens:
+            return [], None
+
+        after = SearchIndex.decode_cursor(cursor) if cursor else None
+        dialect = SearchIndex._dialect()
+
+        # جستجو در پیام‌های اخیر و بایگانی شده و ادغام بر اساس (امتیاز، شناسه)
+        rows = []
+        for model in MESSAGE_MODELS:
+            if dialect == 'sqlite':
+                rows += SearchIndex._search_sqlite(model, user_id, tokens, after, limit + 1)
+            elif dialect == 'postgresql':
+                rows += SearchIndex._search_postgres(model, user_id, tokens, after, limit + 1)
+            else:
+                rows += SearchIndex._search_fallback(model, user_id, tokens, after, limit + 1)
+        rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        ids = [row[0] for row in rows]
+        messages_by_id = {
+            msg.id: msg for model in MESSAGE_MODELS for msg in model.query.filter(model.id.in_(ids)).all()
+        }
+        messages = [messages_by_id[row[0]] for row in rows if row[0] in messages_by_id]
+
+        next_cursor = SearchIndex.encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None
+        return messages, next_cursor
+
+    @staticmethod
+    def _search_sqlite(model, user_id, tokens, after, limit):
+        """جستجو با FTS5 - امتیاز برابر منفی bm25 است (بزرگتر = مرتبط‌تر)"""
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        params = {'match': match, 'user_id': user_id, 'limit': limit}
+
+        cursor_clause = ''
+        if after:
+            cursor_clause = ('AND (-bm25(message_fts) < :score '
+                             'OR (-bm25(message_fts) = :score AND m.id < :after_id))')
+            params.update(score=after[0], after_id=after[1])
+
+        sql = text(f'''
+            SELECT m.id, -bm25(message_fts) AS score
+            FROM message_fts JOIN {model.__tablename__} AS m ON m.id = message_fts.rowid
+            WHERE message_fts MATCH :match
+              AND (m.sender_id = :user_id OR m.receiver_id = :user_id)
+              AND m.is_deleted = 0
+              {cursor_clause}
+            ORDER BY score DESC, m.id DESC
+            LIMIT :limit
+        ''')
+        return db.session.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _search_postgres(model, user_id, tokens, after, limit):
+        """جستجو با tsvector و ایندکس GIN"""
+        vector = func.to_tsvector(_TS_CONFIG, model.search_text)
+        ts_query = func.to_tsquery(_TS_CONFIG, ' & '.join(f'{token}:*' for token in tokens))
+        score = cast(func.ts_rank(vector, ts_query), Float)
+
+        query = db.session.query(model.id, score.label('score')).filter(
+            vector.op('@@')(ts_query),
+            or_(model.sender_id == user_id, model.receiver_id == user_id),
+            model.is_deleted == False
+        )
+        if after:
+            query = query.filter(or_(score < after[0], and_(score == after[0], model.id < after[1])))
+
+        return query.order_by(score.desc(), model.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def _search_fallback(model, user_id, tokens, after, limit):
+        """جستجوی ساده با LIKE برای دیتابیس‌های دیگر (جدیدترها اول)"""
+        query = db.session.query(model.id, literal_column('0.0').label('score')).filter(
+            or_(model.sender_id == user_id, model.receiver_id == user_id),
+            model.is_deleted == False,
+            *[model.search_text.contains(token) for token in tokens]
+        )
+        if after:
+            query = query.filter(model.id < after[1])
+
+        return query.order_by(model.id.desc()).limit(limit).all()
@@ -5,37 +5,332 @@ Business Logic Services
 
 import os
 import json
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import uuid
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import g, request, session, make_response, render_template, current_app
+from markupsafe import Markup
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, and_, func, case
-from pywebpush import webpush, WebPushException
-from app.extensions import db
-from app.models import User, Message, PushSubscription
+from sqlalchemy import or_, and_, func, case, select, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app.extensions import db, push_queue, read_receipts
+from app.cache import LRUCache
+from app.models import User, Message, ArchivedMessage, MESSAGE_MODELS, Conversation, FileBlob, PushSubscription, CacheVersion
+from app.passwords import PasswordHasher
+from app.presence import MemoryPresenceBackend, create_presence_backend
+from app.search import SearchIndex, normalize_text
+from app.storage import blob_path, file_url, write_stream
+from app.thumbnails import ThumbnailService
 from config import Config
 
-# حافظه موقت برای کاربران آنلاین
-ONLINE_USERS_MEMORY = set()
 
 
 class StateManager:
     """مدیریت وضعیت آنلاین/آفلاین کاربران"""
     
+    # backend پیش‌فرض: حافظه همین پروسه (در init_app بر اساس تنظیمات جایگزین می‌شود)
+    _backend = MemoryPresenceBackend()
+    
+    @staticmethod
+    def init_app(app):
+        """انتخاب backend وضعیت آنلاین بر اساس تنظیمات"""
+        StateManager._backend = create_presence_backend(app.config)
+    
+    @staticmethod
+    def set_online(user_id, sid=None):
+        """تنظیم کاربر به حالت آنلاین (هر sid یک اتصال جداگانه است)"""
+        StateManager._backend.connect(user_id, sid)
+
     @staticmethod
-    def set_online(user_id):
-        """تنظیم کاربر به حالت آنلاین"""
-        ONLINE_USERS_MEMORY.add(user_id)
+    def heartbeat(user_id, sid=None):
+        """تمدید اعتبار اتصال کاربر"""
+        StateManager._backend.heartbeat(user_id, sid)
 
     @staticmethod
-    def set_offline(user_id):
-        """تنظیم کاربر به حالت آفلاین"""
-        if user_id in ONLINE_USERS_MEMORY:
-            ONLINE_USERS_MEMORY.remove(user_id)
+    def set_offline(user_id, sid=None):
+        """تنظیم کاربر به حالت آفلاین (بدون sid: تمام اتصال‌ها)"""
+        StateManager._backend.disconnect(user_id, sid)
 
     @staticmethod
     def is_online(user_id):
         """بررسی آنلاین بودن کاربر"""
-        return user_id in ONLINE_USERS_MEMORY
+        return StateManager._backend.connection_count(user_id) > 0
+
+    @staticmethod
+    def is_online_many(user_ids):
+        """بررسی دسته‌ای آنلاین بودن کاربران - مجموعه کاربران آنلاین"""
+        return StateManager._backend.online_many(user_ids)
+
+
+class UserLoader:
+    """بارگذاری دسته‌ای کاربران با identity map در سطح درخواست (جلوگیری از N+1)"""
+    
+    @staticmethod
+    def _cache():
+        if '_user_loader_cache' not in g:
+            g._user_loader_cache = {}
+        return g._user_loader_cache
+    
+    @staticmethod
+    def prime(users):
+        """اضافه کردن کاربرانی که قبلا بارگذاری شده‌اند به cache"""
+        UserLoader._cache().update({user.id: user for user in users})
+    
+    @staticmethod
+    def get_many(user_ids):
+        """دریافت چند کاربر با حداکثر یک کوئری IN - دیکشنری {id: User}"""
+        user_ids = list(user_ids)
+        cache = UserLoader._cache()
+        
+        missing = {user_id for user_id in user_ids if user_id not in cache}
+        if missing:
+            for user in User.query.filter(User.id.in_(missing)).all():
+                cache[user.id] = user
+            for user_id in missing:
+                cache.setdefault(user_id, None)
+        
+        return {user_id: cache[user_id] for user_id in user_ids}
+    
+    @staticmethod
+    def get(user_id):
+        """دریافت یک کاربر از cache درخواست"""
+        return UserLoader.get_many([user_id])[user_id]
+
+
+UserProfile = namedtuple('UserProfile', ['id', 'name', 'theme'])
+
+
+class ProfileCache:
+    """cache پروفایل کاربر (نام و تم) برای context processor و هندلرهای سوکت"""
+    
+    _cache = LRUCache()
+    
+    @staticmethod
+    def init_app(app):
+        """تنظیم اندازه و TTL بر اساس تنظیمات"""
+        ProfileCache._cache.configure(
+            maxsize=app.config.get('PROFILE_CACHE_SIZE', 1024),
+            ttl=app.config.get('PROFILE_CACHE_TTL', 60)
+        )
+    
+    @staticmethod
+    def get(user_id):
+        """دریافت پروفایل کاربر - در صورت نبودن در cache از دیتابیس خوانده می‌شود"""
+        profile = ProfileCache._cache.get(user_id)
+        if profile is None:
+            user = User.query.get(user_id)
+            if user is None:
+                return None
+            profile = UserProfile(user.id, user.name, user.theme)
+            ProfileCache._cache.set(user_id, profile)
+        return profile
+    
+    @staticmethod
+    def invalidate(user_id):
+        """حذف پروفایل از cache بعد از تغییر نام/تم یا حذف حساب"""
+        ProfileCache._cache.delete(user_id)
+
+
+class UserDirectory:
+    """جستجو و صفحه‌بندی کاربران برای صفحه /match"""
+    
+    # تعداد کاربران هر رشته (با ثبت‌نام، تغییر پروفایل و حذف حساب باطل می‌شود)
+    _facet_cache = LRUCache(maxsize=1, ttl=300)
+    
+    @staticmethod
+    def init_app(app):
+        """تنظیم TTL شمارش رشته‌ها"""
+        UserDirectory._facet_cache.configure(ttl=app.config.get('DIRECTORY_FACET_TTL', 300))
+    
+    @staticmethod
+    def major_counts():
+        """لیست (رشته، تعداد کاربران) - از cache"""
+        counts = UserDirectory._facet_cache.get('majors')
+        if counts is None:
+            counts = db.session.query(User.major, func.count(User.id)).filter(
+                User.major.isnot(None), User.major != ''
+            ).group_by(User.major).order_by(func.count(User.id).desc()).all()
+            counts = [tuple(row) for row in counts]
+            UserDirectory._facet_cache.set('majors', counts)
+        return counts
+    
+    @staticmethod
+    def invalidate_facets():
+        """باطل کردن شمارش رشته‌ها"""
+        UserDirectory._facet_cache.delete('majors')
+    
+    @staticmethod
+    def _match_condition(query):
+        """شرط جستجو: زیررشته نام نرمال شده یا رشته تحصیلی"""
+        condition = User.search_name.contains(query, autoescape=True)
+        
+        # تعداد رشته‌ها کم است؛ تطبیق رشته در حافظه و فیلتر با ایندکس major
+        majors = [major for major, _ in UserDirectory.major_counts() if query in normalize_text(major)]
+        if majors:
+            condition = or_(condition, User.major.in_(majors))
+        return condition
+    
+    @staticmethod
+    def search(current_user_id, query='', major=None, after_id=None, limit=None):
+        """یک صفحه از کاربران مرتب شده بر اساس نام - (کاربران، has_more)
+        
+        صفحه‌بندی با cursor روی (search_name, id) آخرین کاربر صفحه قبل است.
+        """
+        limit = limit or Config.DIRECTORY_PAGE_SIZE
+        users = User.query.filter(User.id != current_user_id)
+        
+        query = normalize_text(query)
+        if query:
+            users = users.filter(UserDirectory._match_condition(query))
+        if major:
+            users = users.filter(User.major == major)
+        
+        if after_id:
+            cursor = db.session.query(User.search_name).filter(User.id == after_id).first()
+            if cursor is None:
+                return [], False
+            users = users.filter(or_(
+                User.search_name > cursor.search_name,
+                and_(User.search_name == cursor.search_name, User.id > after_id)
+            ))
+        
+        rows = users.order_by(User.search_name, User.id).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+    
+    @staticmethod
+    def typeahead(current_user_id, query, limit=None):
+        """پیشنهاد کاربران هنگام تایپ: ابتدا شروع نام، سپس زیررشته"""
+        limit = max(1, min(limit or Config.TYPEAHEAD_LIMIT, Config.TYPEAHEAD_MAX_LIMIT))
+        query = normalize_text(query)
+        if len(query) < 2:
+            return []
+        
+        # جستجوی پیشوندی به صورت بازه تا ایندکس B-tree روی هر دو دیتابیس استفاده شود
+        users = User.query.filter(
+            User.id != current_user_id,
+            User.search_name >= query,
+            User.search_name < query + '\uffff'
+        ).order_by(User.search_name, User.id).limit(limit).all()
+        
+        if len(users) < limit:
+            found_ids = [user.id for user in users] + [current_user_id]
+            users += User.query.filter(
+                User.id.notin_(found_ids),
+                User.search_name.contains(query, autoescape=True)
+            ).order_by(User.search_name, User.id).limit(limit - len(users)).all()
+        return users
+
+
+class PageCache:
+    """cache صفحات رندر شده با کلیدهای نسخه‌دار و ETag
+    
+    هر صفحه به نسخه داده‌هایش وابسته است: صندوق پیام هر کاربر (با ارسال، ویرایش،
+    حذف و خواندن پیام) و فهرست کاربران (با ثبت‌نام، تغییر پروفایل و حذف حساب).
+    نسخه‌ها در جدول cache_version و در همان تراکنش تغییر داده بالا می‌روند، پس بین
+    worker ها مشترک‌اند؛ فقط HTML رندر شده در حافظه هر پروسه نگه داشته می‌شود.
+    """
+    
+    DIRECTORY = 'directory'
+    
+    enabled = True
+    _fragments = LRUCache(maxsize=2048, ttl=600)
+    # با تغییر قالب‌ها (deploy جدید) ETag های قبلی معتبر نمی‌مانند
+    _salt = ''
+    
+    @staticmethod
+    def init_app(app):
+        """تنظیم اندازه و TTL و نسخه قالب‌ها"""
+        PageCache.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        PageCache._fragments.configure(
+            maxsize=app.config.get('PAGE_CACHE_SIZE', 2048),
+            ttl=app.config.get('PAGE_CACHE_TTL', 600)
+        )
+        
+        template_dir = os.path.join(app.root_path, app.template_folder)
+        mtimes = [
+            os.path.getmtime(os.path.join(root, name))
+            for root, _, names in os.walk(template_dir) for name in names
+        ]
+        PageCache._salt = str(max(mtimes, default=0))
+    
+    @staticmethod
+    def inbox(user_id):
+        """نام نسخه صندوق پیام کاربر"""
+        return f'inbox:{user_id}'
+    
+    @staticmethod
+    def versions(*names):
+        """نسخه فعلی داده‌ها با یک کوئری (نسخه ثبت نشده صفر است)"""
+        if not PageCache.enabled:
+            return (0,) * len(names)
+        rows = dict(db.session.query(CacheVersion.name, CacheVersion.version).filter(
+            CacheVersion.name.in_(names)
+        ).all())
+        return tuple(rows.get(name, 0) for name in names)
+    
+    @staticmethod
+    def bump(*names):
+        """افزایش نسخه‌ها در تراکنش جاری (قبل از commit تغییر داده صدا زده می‌شود)"""
+        if not PageCache.enabled or not names:
+            return
+        
+        # ترتیب ثابت تا تراکنش‌های همزمان روی ردیف‌های مشترک بن‌بست نشوند
+        values = [{'name': name, 'version': 1} for name in sorted(set(names))]
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(CacheVersion).values(values)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={'version': CacheVersion.version + 1}
+        ))
+    
+    @staticmethod
+    def cached(key, build):
+        """مقدار cache شده برای key، یا ساخت و ذخیره آن"""
+        if not PageCache.enabled:
+            return build()
+        value = PageCache._fragments.get(key)
+        if value is None:
+            value = build()
+            PageCache._fragments.set(key, value)
+        return value
+    
+    @staticmethod
+    def fragment(key, template, context):
+        """HTML رندر شده قالب برای key - context (تابع سازنده متغیرهای قالب) فقط در صورت نبود اجرا می‌شود"""
+        return PageCache.cached(key, lambda: Markup(render_template(template, **context())))
+    
+    @staticmethod
+    def respond(key, render_page):
+        """پاسخ صفحه با ETag؛ اگر If-None-Match برابر باشد 304 بدون رندر
+        
+        key باید تمام داده‌های صفحه (نسخه‌ها و پارامترها) را مشخص کند؛ کاربر جاری
+        و نام و تم او (بخش مشترک قالب) به ETag اضافه می‌شوند.
+        """
+        # پیام‌های flash فقط یک بار نمایش داده می‌شوند و نباید از cache مرورگر بیایند
+        if not PageCache.enabled or '_flashes' in session:
+            return render_page()
+        
+        user_id = session.get('current_user_id')
+        profile = ProfileCache.get(user_id) if user_id else None
+        etag = hashlib.sha1(repr((PageCache._salt, key, profile)).encode()).hexdigest()
+        
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(render_page())
+        response.set_etag(etag)
+        # مرورگر نسخه خود را نگه می‌دارد ولی قبل از استفاده همیشه اعتبارسنجی می‌کند
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
 
 
 class AuthService:
@@ -44,20 +339,34 @@ class AuthService:
     @staticmethod
     def register_user(name, major, password):
         """ثبت‌نام کاربر جدید"""
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        hashed_password = PasswordHasher.hash(password)
         new_user = User(name=name, major=major, password_hash=hashed_password)
         db.session.add(new_user)
+        PageCache.bump(PageCache.DIRECTORY)
         db.session.commit()
+        UserDirectory.invalidate_facets()
         return new_user
 
     @staticmethod
     def authenticate_user(username, password):
-        """احراز هویت کاربر"""
+        """احراز هویت کاربر (hash ساخته شده با تنظیمات قدیمی به‌روز می‌شود)"""
         user = User.query.filter_by(name=username).first()
-        if user and check_password_hash(user.password_hash, password):
+        if user and PasswordHasher.verify(user.password_hash, password):
+            if PasswordHasher.needs_rehash(user.password_hash):
+                user.password_hash = PasswordHasher.hash(password)
+                db.session.commit()
             return user
         return None
 
+    @staticmethod
+    def update_password(user, current_password, new_password):
+        """تغییر رمز عبور در صورت درست بودن رمز فعلی"""
+        if not PasswordHasher.verify(user.password_hash, current_password):
+            return False
+        user.password_hash = PasswordHasher.hash(new_password)
+        db.session.commit()
+        return True
+
 
 class FileService:
     """سرویس مدیریت فایل‌ها"""
@@ -74,29 +383,167 @@ class FileService:
         if file and FileService.allowed_file(file.filename):
             filename = secure_filename(file.filename)
             
-            # ایجاد پوشه uploads در صورت عدم وجود
-            os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-            
-            # ایجاد نام یونیک برای فایل
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-            
-            # ذخیره فایل
-            file.save(file_path)
+            # نوشتن فایل موقت و محاسبه hash در همان عبور
+            temp_path, sha256, file_size = write_stream(file.stream)
+            return FileService.store_blob(temp_path, sha256, file_size, filename)
+        return None
+    
+    @staticmethod
+    def store_blob(temp_path, sha256, file_size, filename):
+        """انتقال فایل موقت به مخزن (محتوای تکراری فقط یک بار ذخیره می‌شود)"""
+        file_type = filename.rsplit('.', 1)[1].lower()
+        
+        # blob موجود ممکن است بی‌ارجاع باشد؛ با تازه کردن created_at تا ثبت پیام
+        # توسط collect_orphan_blobs پاک نمی‌شود
+        touched = FileBlob.query.filter_by(sha256=sha256).update(
+            {FileBlob.created_at: func.now()}, synchronize_session=False
+        )
+        db.session.commit()
+        blob = FileBlob.query.get(sha256) if touched else None
+        
+        if blob and os.path.exists(blob.file_path):
+            os.remove(temp_path)
+        else:
+            path = blob_path(sha256, file_type)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
             
-            # دریافت اطلاعات فایل
-            file_size = os.path.getsize(file_path)
-            file_type = filename.rsplit('.', 1)[1].lower()
+            # ابعاد تصویر برای payload پیام و ساخت پیش‌نمایش در پس‌زمینه
+            dimensions = None
+            if ThumbnailService.is_image(file_type):
+                dimensions = ThumbnailService.image_size(path)
+                if dimensions:
+                    ThumbnailService.schedule(path, sha256)
+            width, height = dimensions or (None, None)
             
-            return {
-                'file_path': file_path,
-                'file_name': filename,
-                'file_type': file_type,
-                'file_size': file_size,
-                'relative_path': f'uploads/{unique_filename}'
-            }
-        return None
+            if blob:
+                blob.file_path = path
+                blob.width, blob.height = width, height
+            else:
+                blob = FileBlob(sha256=sha256, file_path=path, file_size=file_size, ref_count=0,
+                                width=width, height=height)
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(blob)
+                except IntegrityError:
+                    # همان محتوا همزمان توسط درخواست دیگری ذخیره شده است
+                    blob = FileBlob.query.get(sha256)
+            db.session.commit()
+        
+        return {
+            'file_path': blob.file_path,
+            'file_name': filename,
+            'file_type': file_type,
+            'file_size': file_size,
+            'relative_path': file_url(blob.file_path).lstrip('/'),
+            'sha256': sha256
+        }
+    
+    @staticmethod
+    def acquire_blob(sha256):
+        """افزایش شمارنده ارجاع (در تراکنش ذخیره پیام)"""
+        return FileBlob.query.filter_by(sha256=sha256).update(
+            {FileBlob.ref_count: FileBlob.ref_count + 1}, synchronize_session=False
+        ) > 0
+    
+    @staticmethod
+    def release_blob(sha256):
+        """کاهش شمارنده ارجاع - مسیر فایل در صورت بی‌ارجاع شدن برگردانده می‌شود"""
+        FileBlob.query.filter_by(sha256=sha256).update(
+            {FileBlob.ref_count: FileBlob.ref_count - 1}, synchronize_session=False
+        )
+        return FileService._delete_unreferenced_blob(sha256)
+    
+    @staticmethod
+    def _delete_unreferenced_blob(sha256):
+        """حذف ردیف blob بدون ارجاع - مسیر فایل برای حذف بعد از commit"""
+        blob = db.session.query(FileBlob.file_path).filter(
+            FileBlob.sha256 == sha256, FileBlob.ref_count <= 0
+        ).first()
+        if blob is None:
+            return None
+        
+        # جدا کردن پیام‌های حذف شده‌ای که هنوز به این blob اشاره دارند
+        for model in MESSAGE_MODELS:
+            model.query.filter(model.file_hash == sha256).update(
+                {model.file_hash: None}, synchronize_session=False
+            )
+        FileBlob.query.filter(FileBlob.sha256 == sha256, FileBlob.ref_count <= 0).delete(synchronize_session=False)
+        return blob.file_path
+    
+    @staticmethod
+    def collect_orphan_blobs(max_age):
+        """حذف فایل‌هایی که آپلود شده‌اند ولی هیچ پیامی به آن‌ها ارجاع نداده است"""
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+        orphans = db.session.query(FileBlob.sha256).filter(
+            FileBlob.ref_count <= 0,
+            FileBlob.created_at < cutoff
+        ).all()
+        
+        paths = [FileService._delete_unreferenced_blob(sha256) for sha256, in orphans]
+        db.session.commit()
+        
+        for (sha256,), path in zip(orphans, paths):
+            FileService.delete_file(path)
+            ThumbnailService.delete_thumbnails(sha256)
+        return len(orphans)
+    
+    @staticmethod
+    def resolve_download(user_id, filename):
+        """مسیر فایل قابل دانلود برای کاربر - (مسیر، sha256) یا None
+        
+        فقط طرفین پیامی که فایل به آن ضمیمه شده اجازه دانلود دارند.
+        """
+        path = safe_join(Config.UPLOAD_FOLDER, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        
+        if filename.startswith('blobs/'):
+            sha256 = os.path.basename(filename).split('.', 1)[0]
+            attached = lambda model: model.file_hash == sha256
+        else:
+            # فایل‌های قدیمی که قبل از ذخیره‌سازی بر اساس hash آپلود شده‌اند
+            sha256 = None
+            attached = lambda model: model.file_path.endswith(os.sep + os.path.basename(filename))
+        
+        if not FileService._has_attachment(user_id, attached):
+            return None
+        return path, sha256
+    
+    @staticmethod
+    def _has_attachment(user_id, attached):
+        """آیا کاربر طرف پیام حذف نشده‌ای (اخیر یا بایگانی شده) با این فایل است
+        
+        attached: تابعی که برای هر مدل پیام شرط ضمیمه بودن فایل را می‌سازد
+        """
+        for model in MESSAGE_MODELS:
+            owner = db.session.query(model.id).filter(
+                attached(model),
+                model.is_deleted == False,
+                or_(model.sender_id == user_id, model.receiver_id == user_id)
+            ).first()
+            if owner is not None:
+                return True
+        return False
+    
+    @staticmethod
+    def resolve_thumbnail(user_id, sha256, size, fmt):
+        """مسیر پیش‌نمایش تصویر برای کاربر (ساخت در اولین درخواست) - یا None"""
+        if size not in Config.THUMBNAIL_SIZES:
+            return None
+        
+        blob = FileBlob.query.get(sha256)
+        if blob is None or not blob.width:
+            return None
+        
+        if not FileService._has_attachment(user_id, lambda model: model.file_hash == sha256):
+            return None
+        
+        try:
+            return ThumbnailService.get_or_create(blob.file_path, sha256, size, fmt)
+        except Exception as e:
+            print(f"Thumbnail generation failed: {e}")
+            return None
     
     @staticmethod
     def delete_file(file_path):
@@ -110,83 +557,390 @@ class FileService:
         return False
 
 
+class ChunkedUploadService:
+    """سرویس آپلود تکه‌ای و قابل ادامه فایل‌ها (init / chunk / finalize)"""
+    
+    # اندازه بافر خواندن از stream درخواست
+    READ_SIZE = 64 * 1024
+    
+    # وضعیت hash در همین پروسه: upload_id -> (offset, sha256)
+    _hashers = {}
+    
+    @staticmethod
+    def _paths(upload_id):
+        """مسیر فایل داده و فایل اطلاعات آپلود ناتمام"""
+        partial_dir = os.path.join(Config.UPLOAD_FOLDER, '.partial')
+        return os.path.join(partial_dir, f'{upload_id}.part'), os.path.join(partial_dir, f'{upload_id}.json')
+    
+    @staticmethod
+    def _save_meta(upload_id, meta):
+        """ذخیره اتمیک اطلاعات آپلود"""
+        _, meta_path = ChunkedUploadService._paths(upload_id)
+        tmp_path = f'{meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+    
+    @staticmethod
+    def _hasher(upload_id, offset):
+        """دریافت hash تا offset - در صورت نبودن در حافظه از روی فایل محاسبه می‌شود"""
+        cached = ChunkedUploadService._hashers.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+        
+        hasher = hashlib.sha256()
+        data_path, _ = ChunkedUploadService._paths(upload_id)
+        with open(data_path, 'rb') as f:
+            remaining = offset
+            while remaining > 0:
+                block = f.read(min(ChunkedUploadService.READ_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+    
+    @staticmethod
+    def init_upload(user_id, file_name, file_size):
+        """شروع آپلود جدید"""
+        file_name = secure_filename(file_name or '')
+        if not FileService.allowed_file(file_name):
+            return None
+        if not isinstance(file_size, int) or file_size <= 0 or file_size > Config.UPLOAD_MAX_SIZE:
+            return None
+        
+        # پاکسازی آپلودهای رها شده
+        ChunkedUploadService.cleanup_stale_uploads()
+        
+        upload_id = uuid.uuid4().hex
+        data_path, _ = ChunkedUploadService._paths(upload_id)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        open(data_path, 'wb').close()
+        
+        ChunkedUploadService._save_meta(upload_id, {
+            'user_id': user_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'received': 0,
+            'created_at': time.time()
+        })
+        return {
+            'upload_id': upload_id,
+            'offset': 0,
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE
+        }
+    
+    @staticmethod
+    def get_upload(upload_id, user_id):
+        """اطلاعات آپلود ناتمام (فقط برای صاحب آن)"""
+        if not upload_id or not upload_id.isalnum():
+            return None
+        
+        _, meta_path = ChunkedUploadService._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if meta.get('user_id') != user_id:
+            return None
+        return meta
+    
+    @staticmethod
+    def write_chunk(upload_id, user_id, offset, stream):
+        """نوشتن مستقیم یک تکه از stream روی دیسک - بازگشت offset جدید"""
+        meta = ChunkedUploadService.get_upload(upload_id, user_id)
+        if meta is None:
+            return None
+        
+        # تکه‌ها باید به ترتیب برسند؛ در غیر این صورت offset فعلی برگردانده می‌شود
+        if offset != meta['received']:
+            return meta['received']
+        
+        data_path, _ = ChunkedUploadService._paths(upload_id)
+        hasher = ChunkedUploadService._hasher(upload_id, offset)
+        received = offset
+        
+        try:
+            with open(data_path, 'r+b') as f:
+                f.seek(offset)
+                while received < meta['file_size']:
+                    block = stream.read(min(ChunkedUploadService.READ_SIZE, meta['file_size'] - received))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    received += len(block)
+        finally:
+            # حتی در صورت قطع اتصال، بایت‌های نوشته شده ثبت می‌شوند تا آپلود ادامه پیدا کند
+            meta['received'] = received
+            ChunkedUploadService._save_meta(upload_id, meta)
+            ChunkedUploadService._hashers[upload_id] = (received, hasher)
+        
+        return received
+    
+    @staticmethod
+    def finalize_upload(upload_id, user_id):
+        """اتمام آپلود و انتقال فایل به پوشه uploads"""
+        meta = ChunkedUploadService.get_upload(upload_id, user_id)
+        if meta is None or meta['received'] != meta['file_size']:
+            return None
+        
+        data_path, meta_path = ChunkedUploadService._paths(upload_id)
+        content_hash = ChunkedUploadService._hasher(upload_id, meta['received']).hexdigest()
+        
+        file_info = FileService.store_blob(data_path, content_hash, meta['file_size'], meta['file_name'])
+        os.remove(meta_path)
+        ChunkedUploadService._hashers.pop(upload_id, None)
+        return file_info
+    
+    @staticmethod
+    def cleanup_stale_uploads(max_age=None):
+        """حذف آپلودهای ناتمام قدیمی"""
+        max_age = max_age or Config.UPLOAD_PARTIAL_TTL
+        partial_dir = os.path.join(Config.UPLOAD_FOLDER, '.partial')
+        
+        # فایل‌های کامل شده‌ای که به هیچ پیامی متصل نشدند
+        FileService.collect_orphan_blobs(max_age)
+        
+        if not os.path.isdir(partial_dir):
+            return 0
+        
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(partial_dir):
+            path = os.path.join(partial_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        
+        # hash های آپلودهایی که حذف شده‌اند (در این پروسه یا پروسه‌ای دیگر)
+        for upload_id in list(ChunkedUploadService._hashers):
+            data_path, _ = ChunkedUploadService._paths(upload_id)
+            if not os.path.exists(data_path):
+                ChunkedUploadService._hashers.pop(upload_id, None)
+        return removed
+
+
 class ChatService:
     """سرویس چت و پیام‌رسانی"""
     
+    # اندازه صفحه تاریخچه چت
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_MAX_PAGE_SIZE = 100
+    
+    # حداکثر تعداد تغییرات در هر پاسخ sync
+    SYNC_PAGE_SIZE = 200
+    
+    @staticmethod
+    def _get_conversation(user_a, user_b, create=False):
+        """دریافت (و در صورت نیاز ساخت) خلاصه مکالمه بین دو کاربر"""
+        user_lo_id, user_hi_id = Conversation.pair(user_a, user_b)
+        conversation = Conversation.query.filter_by(user_lo_id=user_lo_id, user_hi_id=user_hi_id).first()
+        
+        if conversation is None and create:
+            conversation = Conversation(user_lo_id=user_lo_id, user_hi_id=user_hi_id, unread_lo=0, unread_hi=0)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(conversation)
+            except IntegrityError:
+                # مکالمه همزمان توسط درخواست دیگری ساخته شده است
+                conversation = Conversation.query.filter_by(user_lo_id=user_lo_id, user_hi_id=user_hi_id).one()
+        return conversation
+    
+    @staticmethod
+    def _unread_column(conversation, user_id):
+        """ستون شمارنده خوانده نشده مربوط به کاربر"""
+        return 'unread_lo' if user_id == conversation.user_lo_id else 'unread_hi'
+    
+    @staticmethod
+    def _next_seq(conversation, count=1):
+        """رزرو count شماره رویداد بعدی مکالمه - بازگشت آخرین شماره رزرو شده
+        
+        افزایش در خود دیتابیس انجام می‌شود تا درخواست‌های همزمان شماره تکراری نگیرند.
+        """
+        return db.session.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation.id)
+            .values(last_seq=Conversation.last_seq + count)
+            .returning(Conversation.last_seq)
+        ).scalar_one()
+    
     @staticmethod
     def get_inbox_conversations(user_id):
         """دریافت لیست مکالمات کاربر"""
         other_user_id = case(
-            (Message.sender_id == user_id, Message.receiver_id),
-            else_=Message.sender_id
-        ).label("other_user_id")
+            (Conversation.user_lo_id == user_id, Conversation.user_hi_id),
+            else_=Conversation.user_lo_id
+        )
 
-        subquery = db.session.query(
-            func.max(Message.id).label("last_message_id")
-        ).filter(
-            or_(Message.sender_id == user_id, Message.receiver_id == user_id),
-            Message.is_deleted == False
-        ).group_by(other_user_id).subquery()
-
-        results = db.session.query(
-            Message, 
-            User, 
-            func.sum(
-                case(
-                    (and_(Message.receiver_id == user_id, Message.read_at.is_(None)), 1), 
-                    else_=0
-                )
-            ).label("unread_count")
-        ).join(
-            subquery, Message.id == subquery.c.last_message_id
-        ).join(
+        results = db.session.query(Conversation, User).join(
             User, User.id == other_user_id
-        ).group_by(Message.id, User.id).order_by(Message.timestamp.desc()).all()
+        ).filter(
+            or_(Conversation.user_lo_id == user_id, Conversation.user_hi_id == user_id),
+            Conversation.last_message_id.isnot(None)
+        ).order_by(Conversation.last_message_at.desc(), Conversation.last_message_id.desc()).all()
 
+        UserLoader.prime(other_user for _, other_user in results)
+        online_ids = StateManager.is_online_many([other_user.id for _, other_user in results])
+        
         conversations = []
-        for msg, other_user, unread in results:
+        for conversation, other_user in results:
             conversations.append({
                 'other_user_id': other_user.id,
                 'other_user_name': other_user.name,
-                'last_message_content': msg.content,
-                'last_message_timestamp': msg.timestamp,
-                'has_unread': unread > 0,
-                'is_online': StateManager.is_online(other_user.id)
+                'last_message_content': conversation.last_message_preview,
+                'last_message_timestamp': conversation.last_message_at,
+                'has_unread': conversation.unread_count(user_id) > 0,
+                'is_online': other_user.id in online_ids
             })
         return conversations
 
+    @staticmethod
+    def _last_read_column(conversation, user_id):
+        """ستون watermark خواندن مربوط به کاربر"""
+        return 'last_read_lo_id' if user_id == conversation.user_lo_id else 'last_read_hi_id'
+    
     @staticmethod
     def get_chat_history(current_user_id, other_user_id, limit=50):
         """دریافت تاریخچه چت بین دو کاربر"""
-        # علامت‌گذاری پیام‌ها به عنوان خوانده شده
-        Message.query.filter(
-            and_(
-                Message.sender_id == other_user_id,
-                Message.receiver_id == current_user_id,
-                Message.read_at.is_(None),
-                Message.is_deleted == False
+        # دریافت آخرین صفحه پیام‌ها
+        messages, _ = ChatService.get_messages_page(current_user_id, other_user_id, limit=limit)
+        
+        # علامت‌گذاری پیام‌ها به عنوان خوانده شده (فقط اگر پیام خوانده نشده‌ای وجود دارد)
+        conversation = ChatService._get_conversation(current_user_id, other_user_id)
+        if messages and conversation and conversation.unread_count(current_user_id) > 0:
+            read_receipts.enqueue(current_user_id, other_user_id, messages[-1].id)
+        return messages
+    
+    @staticmethod
+    def apply_read_watermarks(watermarks):
+        """ثبت دسته‌ای watermark های خواندن در یک تراکنش
+        
+        watermarks: {(reader_id, other_user_id): message_id}
+        بازگشت: لیست (reader_id, sender_id, last_read_id) برای ارسال رسید
+        """
+        receipts = []
+        for (reader_id, other_user_id), message_id in watermarks.items():
+            conversation = ChatService._get_conversation(reader_id, other_user_id)
+            if conversation is None or conversation.last_message_id is None:
+                continue
+            
+            # watermark فقط رو به جلو و حداکثر تا آخرین پیام مکالمه حرکت می‌کند
+            last_read_column = ChatService._last_read_column(conversation, reader_id)
+            previous_id = getattr(conversation, last_read_column)
+            last_read_id = min(message_id, conversation.last_message_id)
+            if last_read_id <= previous_id:
+                continue
+            setattr(conversation, last_read_column, last_read_id)
+            
+            # read_at فقط برای پیام‌های بین دو watermark (محدوده کلید اصلی) ثبت می‌شود
+            marked = sum(
+                model.query.filter(
+                    model.sender_id == other_user_id,
+                    model.receiver_id == reader_id,
+                    model.id > previous_id,
+                    model.id <= last_read_id,
+                    model.read_at.is_(None),
+                    model.is_deleted == False
+                ).update({model.read_at: func.now()}, synchronize_session=False)
+                for model in MESSAGE_MODELS
             )
-        ).update({Message.read_at: func.now()}, synchronize_session=False)
+            
+            if marked:
+                unread_column = getattr(Conversation, ChatService._unread_column(conversation, reader_id))
+                setattr(conversation, unread_column.key,
+                        case((unread_column > marked, unread_column - marked), else_=0))
+            
+            receipts.append((reader_id, other_user_id, last_read_id))
+        
+        # وضعیت خوانده نشده در صندوق پیام خواننده‌ها
+        PageCache.bump(*[PageCache.inbox(reader_id) for reader_id, _, _ in receipts])
         db.session.commit()
+        return receipts
 
-        # دریافت پیام‌ها
-        messages = Message.query.filter(
-            or_(
-                and_(Message.sender_id == current_user_id, Message.receiver_id == other_user_id),
-                and_(Message.sender_id == other_user_id, Message.receiver_id == current_user_id)
-            ),
-            Message.is_deleted == False
-        ).order_by(Message.timestamp.desc()).limit(limit).all()
+    @staticmethod
+    def get_messages_page(current_user_id, other_user_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+        """دریافت یک صفحه از تاریخچه چت با cursor روی (timestamp, id)
+        
+        پیام‌های اخیر و بایگانی شده با هم ادغام می‌شوند.
+        """
+        limit = max(1, min(limit, ChatService.HISTORY_MAX_PAGE_SIZE))
         
-        return messages[::-1]
+        # پیدا کردن جدول cursor (پیام حذف شده هم می‌تواند cursor باشد)
+        cursor_id = before_id or after_id
+        cursor_timestamp = None
+        if cursor_id:
+            for cursor_model in MESSAGE_MODELS:
+                found = db.session.query(cursor_model.id).filter(
+                    cursor_model.id == cursor_id,
+                    Conversation.messages_of(current_user_id, other_user_id, cursor_model)
+                ).first()
+                if found is not None:
+                    break
+            else:
+                return [], False
+            # مقایسه با مقدار ذخیره شده timestamp، نه datetime پایتون: SQLite مقدار
+            # func.now() را بدون میکروثانیه ذخیره می‌کند و مقایسه رشته‌ای با
+            # '... .000000' خود cursor و پیام‌های همان ثانیه را اشتباه جدا می‌کند
+            cursor_timestamp = select(cursor_model.timestamp).where(
+                cursor_model.id == cursor_id
+            ).scalar_subquery()
+        
+        rows = []
+        for model in MESSAGE_MODELS:
+            # پیام‌های بایگانی شده هر مکالمه از تمام پیام‌های باقی‌مانده در message
+            # قدیمی‌ترند؛ صفحه پیام‌های قدیمی‌تر اگر از message پر شد به بایگانی نیازی نیست
+            if model is ArchivedMessage and not after_id and len(rows) > limit:
+                break
+            
+            # ابعاد پیش‌نمایش (file_info) از file_blob در همان کوئری خوانده می‌شود
+            query = model.query.options(joinedload(model.blob)).filter(
+                Conversation.messages_of(current_user_id, other_user_id, model),
+                model.is_deleted == False
+            )
+            if cursor_timestamp is not None:
+                # مقایسه row-value تا cursor مرز بازه ایندکس (کلید مکالمه، timestamp، id) باشد
+                position = tuple_(model.timestamp, model.id)
+                if before_id:
+                    query = query.filter(position < tuple_(cursor_timestamp, cursor_id))
+                else:
+                    query = query.filter(position > tuple_(cursor_timestamp, cursor_id))
+            
+            # یک ردیف اضافه برای تشخیص وجود صفحه بعدی
+            if after_id:
+                rows += query.order_by(model.timestamp.asc(), model.id.asc()).limit(limit + 1).all()
+            else:
+                rows += query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+        
+        rows.sort(key=lambda msg: (msg.timestamp, msg.id), reverse=not after_id)
+        if after_id:
+            return rows[:limit], len(rows) > limit
+        return rows[:limit][::-1], len(rows) > limit
 
     @staticmethod
-    def save_message(sender_id, receiver_id, content, file_info=None):
-        """ذخیره پیام جدید"""
+    def save_message(sender_id, receiver_id, content, file_info=None, client_id=None):
+        """ذخیره پیام جدید - None اگر فایل ضمیمه دیگر موجود نباشد"""
+        # ارسال مجدد پیامی که قبلا ذخیره شده (بعد از قطع اتصال)
+        if client_id:
+            existing = Message.query.filter_by(sender_id=sender_id, client_id=client_id).first()
+            if existing:
+                return existing
+        
+        # ثبت ارجاع به فایل ذخیره شده بر اساس hash - اگر فایل در این فاصله
+        # جمع‌آوری شده باشد پیام ذخیره نمی‌شود (None)
+        if file_info and not FileService.acquire_blob(file_info.get('sha256')):
+            return None
+        
         msg = Message(
             sender_id=sender_id, 
             receiver_id=receiver_id, 
-            content=content
+            content=content,
+            client_id=client_id
         )
         
         # اضافه کردن اطلاعات فایل در صورت وجود
@@ -195,50 +949,221 @@ class ChatService:
             msg.file_name = file_info.get('file_name')
             msg.file_type = file_info.get('file_type')
             msg.file_size = file_info.get('file_size')
+            msg.file_hash = file_info['sha256']
+        
+        conversation = ChatService._get_conversation(sender_id, receiver_id, create=True)
+        msg.seq = ChatService._next_seq(conversation)
         
         db.session.add(msg)
+        db.session.flush()
+        SearchIndex.index_message(msg)
+        
+        # بروزرسانی خلاصه مکالمه در همان تراکنش
+        conversation.last_message_id = msg.id
+        conversation.last_message_preview = content[:Conversation.PREVIEW_LENGTH]
+        conversation.last_message_at = func.now()
+        unread_column = ChatService._unread_column(conversation, receiver_id)
+        setattr(conversation, unread_column, getattr(Conversation, unread_column) + 1)
+        PageCache.bump(PageCache.inbox(sender_id), PageCache.inbox(receiver_id))
+        
         db.session.commit()
         return msg
     
+    @staticmethod
+    def save_messages_batch(batch):
+        """ذخیره دسته‌ای پیام‌های write-behind در یک تراکنش
+        
+        batch: لیست PendingMessage (app/writer.py)
+        بازگشت: لیست (PendingMessage، شناسه پیام)
+        """
+        # پیام‌های ارسال مجدد که قبلا ذخیره شده‌اند فقط یک بار ثبت می‌شوند
+        client_ids = {pending.client_id for pending in batch}
+        sender_ids = {pending.sender_id for pending in batch}
+        existing = {
+            (sender_id, client_id): message_id
+            for message_id, sender_id, client_id in db.session.query(
+                Message.id, Message.sender_id, Message.client_id
+            ).filter(Message.sender_id.in_(sender_ids), Message.client_id.in_(client_ids))
+        }
+        
+        new_messages = []
+        by_pair = {}
+        for pending in batch:
+            key = (pending.sender_id, pending.client_id)
+            if key in existing:
+                continue
+            msg = Message(
+                sender_id=pending.sender_id,
+                receiver_id=pending.receiver_id,
+                content=pending.content,
+                client_id=pending.client_id
+            )
+            existing[key] = msg
+            new_messages.append(msg)
+            by_pair.setdefault(Conversation.pair(msg.sender_id, msg.receiver_id), []).append(msg)
+        
+        # یک بازه شماره رویداد برای پیام‌های هر مکالمه
+        conversations = {}
+        for pair, messages in by_pair.items():
+            conversation = ChatService._get_conversation(*pair, create=True)
+            last_seq = ChatService._next_seq(conversation, len(messages))
+            for offset, msg in enumerate(messages):
+                msg.seq = last_seq - len(messages) + 1 + offset
+            conversations[pair] = [conversation, {}]
+        
+        db.session.add_all(new_messages)
+        db.session.flush()
+        
+        # یک بروزرسانی برای هر مکالمه (آخرین پیام و مجموع پیام‌های خوانده نشده)
+        for msg in new_messages:
+            SearchIndex.index_message(msg)
+            
+            conversation, unread = conversations[Conversation.pair(msg.sender_id, msg.receiver_id)]
+            conversation.last_message_id = msg.id
+            conversation.last_message_preview = msg.content[:Conversation.PREVIEW_LENGTH]
+            conversation.last_message_at = func.now()
+            unread_column = ChatService._unread_column(conversation, msg.receiver_id)
+            unread[unread_column] = unread.get(unread_column, 0) + 1
+        
+        for conversation, unread in conversations.values():
+            for unread_column, count in unread.items():
+                setattr(conversation, unread_column, getattr(Conversation, unread_column) + count)
+        PageCache.bump(*[PageCache.inbox(user_id) for pair in conversations for user_id in pair])
+        
+        db.session.commit()
+        
+        saved = []
+        for pending in batch:
+            message = existing[(pending.sender_id, pending.client_id)]
+            saved.append((pending, message if isinstance(message, int) else message.id))
+        return saved
+    
+    @staticmethod
+    def get_sent_message(message_id, sender_id, receiver_id):
+        """دریافت پیام ذخیره شده کاربر برای انتشار در اتاق چت"""
+        return Message.query.filter_by(
+            id=message_id,
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            is_deleted=False
+        ).first()
+    
+    @staticmethod
+    def _find_message(message_id):
+        """پیام با شناسه در message یا در صورت نبود در message_archive"""
+        return (Message.query.get(message_id)
+                or ArchivedMessage.query.filter_by(id=message_id).first())
+    
     @staticmethod
     def edit_message(message_id, new_content, current_user_id):
         """ویرایش پیام"""
-        msg = Message.query.get(message_id)
+        msg = ChatService._find_message(message_id)
         if msg and msg.sender_id == current_user_id and not msg.is_deleted:
             msg.content = new_content
             msg.edited_at = func.now()
+            SearchIndex.index_message(msg)
+            
+            conversation = ChatService._get_conversation(msg.sender_id, msg.receiver_id, create=True)
+            msg.seq = ChatService._next_seq(conversation)
+            
+            # بروزرسانی پیش‌نمایش اگر آخرین پیام مکالمه ویرایش شده باشد
+            if conversation.last_message_id == msg.id:
+                conversation.last_message_preview = new_content[:Conversation.PREVIEW_LENGTH]
+                PageCache.bump(PageCache.inbox(msg.sender_id), PageCache.inbox(msg.receiver_id))
+            
             db.session.commit()
-            return True
-        return False
+            return msg
+        return None
     
     @staticmethod
     def delete_message(message_id, current_user_id):
         """حذف پیام"""
-        msg = Message.query.get(message_id)
+        msg = ChatService._find_message(message_id)
         if msg and msg.sender_id == current_user_id:
+            was_visible = not msg.is_deleted
             msg.is_deleted = True
+            file_hash = msg.file_hash
+            orphan_path = None
             
-            # حذف فایل ضمیمه در صورت وجود
-            if msg.file_path:
-                FileService.delete_file(msg.file_path)
+            if was_visible:
+                ChatService._update_conversation_on_delete(msg)
+                SearchIndex.remove_message(msg)
+                
+                # tombstone برای همگام‌سازی کلاینت‌هایی که آفلاین بوده‌اند
+                # (بعد از MESSAGE_PURGE_AFTER_DAYS کاملا پاک می‌شود)
+                msg.deleted_at = func.now()
+                conversation = ChatService._get_conversation(msg.sender_id, msg.receiver_id, create=True)
+                msg.seq = ChatService._next_seq(conversation)
+                PageCache.bump(PageCache.inbox(msg.sender_id), PageCache.inbox(msg.receiver_id))
+                
+                # فایل ضمیمه مشترک فقط بعد از حذف آخرین ارجاع پاک می‌شود
+                if file_hash:
+                    orphan_path = FileService.release_blob(file_hash)
+                elif msg.file_path:
+                    orphan_path = msg.file_path
             
             db.session.commit()
-            return True
-        return False
+            
+            if orphan_path:
+                FileService.delete_file(orphan_path)
+                if file_hash:
+                    ThumbnailService.delete_thumbnails(file_hash)
+            return msg
+        return None
     
     @staticmethod
-    def search_messages(user_id, query):
-        """جستجو در پیام‌های کاربر"""
-        messages = Message.query.filter(
-            or_(
-                Message.sender_id == user_id,
-                Message.receiver_id == user_id
-            ),
-            Message.content.contains(query),
-            Message.is_deleted == False
-        ).order_by(Message.timestamp.desc()).limit(50).all()
+    def _update_conversation_on_delete(msg):
+        """بروزرسانی خلاصه مکالمه بعد از حذف پیام"""
+        conversation = ChatService._get_conversation(msg.sender_id, msg.receiver_id)
+        if conversation is None:
+            return
         
-        return messages
+        # کم کردن شمارنده خوانده نشده گیرنده
+        if msg.read_at is None:
+            unread_column = getattr(Conversation, ChatService._unread_column(conversation, msg.receiver_id))
+            setattr(conversation, unread_column.key, case((unread_column > 0, unread_column - 1), else_=0))
+        
+        # جایگزینی آخرین پیام با پیام قبلی (در صورت نبود در message، از بایگانی)
+        if conversation.last_message_id == msg.id:
+            previous = None
+            for model in MESSAGE_MODELS:
+                previous = model.query.filter(
+                    Conversation.messages_of(msg.sender_id, msg.receiver_id, model),
+                    model.is_deleted == False
+                ).order_by(model.timestamp.desc(), model.id.desc()).first()
+                if previous:
+                    break
+            
+            conversation.last_message_id = previous.id if previous else None
+            conversation.last_message_preview = previous.content[:Conversation.PREVIEW_LENGTH] if previous else None
+            conversation.last_message_at = previous.timestamp if previous else None
+    
+    @staticmethod
+    def get_last_seq(current_user_id, other_user_id):
+        """آخرین شماره رویداد مکالمه (نقطه شروع sync برای صفحه رندر شده)"""
+        conversation = ChatService._get_conversation(current_user_id, other_user_id)
+        return conversation.last_seq if conversation else 0
+    
+    @staticmethod
+    def get_sync_events(current_user_id, other_user_id, since_seq, limit=SYNC_PAGE_SIZE):
+        """تغییرات مکالمه بعد از since_seq (پیام جدید، ویرایش و tombstone حذف)
+        
+        هر پیام فقط با آخرین وضعیتش برگردانده می‌شود - بازگشت (پیام‌ها، has_more)
+        """
+        rows = []
+        for model in MESSAGE_MODELS:
+            rows += model.query.options(joinedload(model.blob)).filter(
+                Conversation.messages_of(current_user_id, other_user_id, model),
+                model.seq > since_seq
+            ).order_by(model.seq.asc()).limit(limit + 1).all()
+        
+        rows.sort(key=lambda msg: msg.seq)
+        return rows[:limit], len(rows) > limit
+    
+    @staticmethod
+    def search_messages(user_id, query, cursor=None, limit=50):
+        """جستجو در پیام‌های کاربر - (پیام‌ها، cursor صفحه بعد)"""
+        return SearchIndex.search(user_id, query, cursor=cursor, limit=limit)
 
 
 class NotificationService:
@@ -265,38 +1190,6 @@ class NotificationService:
         return subscription
     
     @staticmethod
-    def send_notification(user_id, title, body, data=None):
-        """ارسال نوتیفیکیشن به کاربر"""
-        subscriptions = PushSubscription.query.filter_by(user_id=user_id).all()
-        
-        notification_data = {
-            'title': title,
-            'body': body,
-            'icon': '/static/images/logo.png',
-            'data': data or {}
-        }
-        
-        for subscription in subscriptions:
-            try:
-                subscription_info = {
-                    'endpoint': subscription.endpoint,
-                    'keys': {
-                        'p256dh': subscription.p256dh,
-                        'auth': subscription.auth
-                    }
-                }
-                
-                webpush(
-                    subscription_info=subscription_info,
-                    data=json.dumps(notification_data),
-                    vapid_private_key=Config.VAPID_PRIVATE_KEY,
-                    vapid_claims={
-                        "sub": Config.VAPID_CLAIM_EMAIL
-                    }
-                )
-            except WebPushException as e:
-                print(f"Web Push failed: {e}")
-                # حذف اشتراک نامعتبر
-                if e.response and e.response.status_code in [404, 410]:
-                    db.session.delete(subscription)
-                    db.session.commit()
\ No newline at end of file
+    def queue_notification(user_id, title, body, data=None, sender_id=None):
+        """ارسال نوتیفیکیشن در پس‌زمینه (پیام‌های پشت سر هم یک فرستنده ادغام می‌شوند)"""
+        push_queue.enqueue(user_id, title, body, data, sender_id=sender_id)
@@ -0,0 +1,51 @@
+"""
+Content-Addressed File Storage
+ذخیره‌سازی فایل‌ها بر اساس hash محتوا
+
+هر محتوای یکتا فقط یک بار با مسیر blobs/<ab>/<cd>/<sha256>.<ext> ذخیره
+می‌شود. شمارش ارجاع‌ها در جدول file_blob نگهداری می‌شود (FileService).
+"""
+
+import os
+import uuid
+import hashlib
+from config import Config
+
+READ_SIZE = 64 * 1024
+
+
+def blob_path(sha256, ext):
+    """مسیر shard شده فایل برای یک hash"""
+    return os.path.join(Config.UPLOAD_FOLDER, 'blobs', sha256[:2], sha256[2:4], f'{sha256}.{ext}')
+
+
+def tmp_path():
+    """مسیر موقت برای نوشتن فایل قبل از محاسبه hash"""
+    tmp_dir = os.path.join(Config.UPLOAD_FOLDER, 'blobs', 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, uuid.uuid4().hex)
+
+
+def write_stream(stream):
+    """نوشتن stream روی فایل موقت با محاسبه همزمان hash - (مسیر، sha256، حجم)"""
+    path = tmp_path()
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(READ_SIZE)
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            size += len(block)
+    return path, hasher.hexdigest(), size
+
+
+def file_url(file_path):
+    """آدرس دانلود فایل نسبت به پوشه uploads"""
+    relative = os.path.relpath(file_path, Config.UPLOAD_FOLDER).replace(os.sep, '/')
+    if relative.startswith('..'):
+        # مسیرهای قدیمی خارج از پوشه فعلی uploads
+        relative = os.path.basename(file_path)
+    return f'/uploads/{relative}'
@@ -0,0 +1,139 @@
+"""
+Image Thumbnails
+ساخت پیش‌نمایش تصاویر ضمیمه با Pillow
+
+پیش‌نمایش‌ها در چند اندازه و با فرمت WebP (یا JPEG برای مرورگرهای قدیمی)
+ساخته می‌شوند، اطلاعات EXIF حذف می‌شود و نتیجه روی دیسک cache می‌شود.
+ساخت در پس‌زمینه بعد از آپلود شروع می‌شود و اگر هنوز آماده نباشد در
+اولین درخواست انجام می‌شود.
+
+زیر eventlet thread های ThreadPoolExecutor هم green هستند، پس خواندن،
+تغییر اندازه و encode تصویر در thread pool واقعی (eventlet.tpool) اجرا
+می‌شود تا hub و سوکت‌های پروسه منتظر Pillow نمانند.
+"""
+
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from config import Config
+
+# فرمت خروجی -> (فرمت Pillow، پسوند، mimetype)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+
+class ThumbnailService:
+    """سرویس ساخت و cache پیش‌نمایش تصاویر"""
+
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnail')
+
+    @staticmethod
+    def is_image(file_type):
+        """آیا برای این نوع فایل پیش‌نمایش ساخته می‌شود"""
+        return (file_type or '').lower() in Config.THUMBNAIL_EXTENSIONS
+
+    @staticmethod
+    def image_size(path):
+        """ابعاد تصویر (فقط header خوانده می‌شود) - در صورت خطا None"""
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+                # ابعاد بعد از اعمال چرخش EXIF
+                if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                    width, height = height, width
+                return width, height
+        except Exception:
+            return None
+
+    @staticmethod
+    def scaled_size(width, height, bound):
+        """ابعاد پیش‌نمایش با حفظ نسبت (بدون بزرگ‌نمایی)"""
+        scale = min(1.0, bound / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    @staticmethod
+    def thumbnail_path(sha256, size, fmt):
+        """مسیر cache پیش‌نمایش"""
+        ext = FORMATS[fmt][1]
+        return os.path.join(Config.UPLOAD_FOLDER, 'thumbs', sha256[:2], f'{sha256}_{size}.{ext}')
+
+    @staticmethod
+    def _run(func, *args):
+        """اجرا در tpool وقتی eventlet فعال است، در غیر این صورت مستقیم"""
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'):
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    @staticmethod
+    def get_or_create(source_path, sha256, size, fmt):
+        """مسیر پیش‌نمایش - در صورت نبودن همین‌جا (در thread pool) ساخته می‌شود"""
+        path = ThumbnailService.thumbnail_path(sha256, size, fmt)
+        if os.path.exists(path):
+            return path
+
+        ThumbnailService._run(ThumbnailService._create, source_path, path, size, fmt)
+        return path
+
+    @staticmethod
+    def _create(source_path, path, size, fmt):
+        """ساخت یک پیش‌نمایش با Pillow (مسدود کننده)"""
+        bound = Config.THUMBNAIL_SIZES[size]
+        pil_format = FORMATS[fmt][0]
+
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.resize(
+                ThumbnailService.scaled_size(image.width, image.height, bound),
+                Image.LANCZOS
+            )
+
+            if pil_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if pil_format == 'WEBP' and 'A' in image.mode else 'RGB')
+
+            # نوشتن اتمیک؛ بدون exif تا متادیتای تصویر اصلی منتشر نشود
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            image.save(tmp_path, pil_format, quality=Config.THUMBNAIL_QUALITY)
+            os.replace(tmp_path, path)
+
+    @staticmethod
+    def delete_thumbnails(sha256):
+        """حذف تمام پیش‌نمایش‌های یک فایل"""
+        for size in Config.THUMBNAIL_SIZES:
+            for fmt in FORMATS:
+                try:
+                    os.remove(ThumbnailService.thumbnail_path(sha256, size, fmt))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _generate_all(source_path, sha256):
+        for size in Config.THUMBNAIL_SIZES:
+            for fmt in FORMATS:
+                try:
+                    ThumbnailService.get_or_create(source_path, sha256, size, fmt)
+                except Exception as e:
+                    print(f"Thumbnail generation failed: {e}")
+                    return
+
+    @staticmethod
+    def schedule(source_path, sha256):
+        """ساخت پیش‌نمایش‌ها در پس‌زمینه بعد از آپلود"""
+        ThumbnailService._executor.submit(ThumbnailService._generate_all, source_path, sha256)
+
+    @staticmethod
+    def thumbnails_for(sha256, width, height):
+        """آدرس و ابعاد پیش‌نمایش‌ها برای payload پیام"""
+        thumbnails = {}
+        for size, bound in Config.THUMBNAIL_SIZES.items():
+            thumb_width, thumb_height = ThumbnailService.scaled_size(width, height, bound)
+            thumbnails[size] = {
+                'url': f'/thumbnails/{sha256}/{size}',
+                'width': thumb_width,
+                'height': thumb_height
+            }
+        return thumbnails
@@ -0,0 +1,112 @@
+"""
+Typing Indicator
+وضعیت «در حال تایپ» هر کاربر در هر اتاق
+
+کلاینت در حین تایپ رویداد typing را تکرار می‌کند؛ سرور وضعیت هر
+(کاربر، اتاق) را نگه می‌دارد و فقط تغییر وضعیت (شروع یا توقف تایپ) را
+به اتاق ارسال می‌کند. اگر stop_typing نرسد (مثلا قطع شدن اتصال) وضعیت
+بعد از TYPING_TIMEOUT ثانیه منقضی و stop_typing ارسال می‌شود.
+"""
+
+import re
+import threading
+import time
+
+CHAT_ROOM_PATTERN = re.compile(r'^chat-(\d+)-(\d+)$')
+
+
+def chat_room_members(room):
+    """شناسه دو کاربر یک اتاق چت، یا None برای نام نامعتبر"""
+    match = CHAT_ROOM_PATTERN.match(room) if isinstance(room, str) else None
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+class TypingTracker:
+    """نگهداری وضعیت تایپ و انقضای خودکار آن"""
+
+    def __init__(self):
+        self.app = None
+        self._started = False
+        self._condition = threading.Condition()
+        self._typing = {}  # (user_id, room) -> (expires_at, sid)
+        self._last_start = {}  # (user_id, room) -> زمان آخرین شروع ارسال شده
+
+    def init_app(self, app):
+        """خواندن تنظیمات (thread انقضا در اولین رویداد شروع می‌شود)"""
+        self.app = app
+        self.timeout = app.config.get('TYPING_TIMEOUT', 5.0)
+        self.min_interval = app.config.get('TYPING_MIN_INTERVAL', 1.0)
+
+    def _start(self):
+        """راه‌اندازی thread انقضا (باید با قفل صدا زده شود)"""
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._expire_loop, name='typing-expiry', daemon=True).start()
+
+    def start(self, user_id, room, sid):
+        """ثبت تایپ کردن؛ True اگر شروع تایپ باید به اتاق ارسال شود
+
+        تکرار typing فقط زمان انقضا را تمدید می‌کند. شروع دوباره زودتر از
+        TYPING_MIN_INTERVAL بعد از شروع قبلی نادیده گرفته می‌شود تا کلاینت
+        با typing/stop_typing پشت سر هم اتاق را پر نکند.
+        """
+        key = (user_id, room)
+        now = time.monotonic()
+        with self._condition:
+            self._start()
+            if key in self._typing:
+                self._typing[key] = (now + self.timeout, sid)
+                return False
+            if now - self._last_start.get(key, float('-inf')) < self.min_interval:
+                return False
+
+            self._typing[key] = (now + self.timeout, sid)
+            self._last_start[key] = now
+            self._condition.notify()
+            return True
+
+    def stop(self, user_id, room):
+        """توقف تایپ؛ True اگر کاربر در حال تایپ بود و توقف باید ارسال شود"""
+        with self._condition:
+            return self._typing.pop((user_id, room), None) is not None
+
+    def disconnect(self, sid):
+        """حذف وضعیت‌های یک اتصال قطع شده؛ لیست (user_id, room) برای ارسال توقف"""
+        with self._condition:
+            stopped = [key for key, (_, key_sid) in self._typing.items() if key_sid == sid]
+            for key in stopped:
+                del self._typing[key]
+        return stopped
+
+    def _expire_loop(self):
+        """بررسی دوره‌ای وضعیت‌های منقضی شده"""
+        while True:
+            with self._condition:
+                while not self._typing and not self._last_start:
+                    self._condition.wait()
+            time.sleep(min(1.0, self.timeout / 2))
+
+            try:
+                self.expire()
+            except Exception as e:
+                print(f"Typing expiry failed: {e}")
+
+    def expire(self):
+        """ارسال stop_typing برای وضعیت‌هایی که stop_typing آن‌ها نرسیده"""
+        from app.extensions import socketio
+
+        now = time.monotonic()
+        with self._condition:
+            expired = [(key, sid) for key, (expires_at, sid) in self._typing.items() if expires_at <= now]
+            for key, _ in expired:
+                del self._typing[key]
+            for key in [key for key, started in self._last_start.items()
+                        if now - started >= self.min_interval and key not in self._typing]:
+                del self._last_start[key]
+
+        for (user_id, room), sid in expired:
+            socketio.emit('stop_typing', {'user_id': user_id}, room=room, skip_sid=sid)
+        return len(expired)
@@ -0,0 +1,140 @@
+"""
+Write-Behind Message Writer
+ذخیره دسته‌ای (group commit) پیام‌های متنی
+
+در حالت MESSAGE_WRITE_BEHIND پیام بلافاصله منتشر می‌شود و ذخیره آن به این
+writer سپرده می‌شود. پیام‌ها هر MESSAGE_BATCH_INTERVAL ثانیه یا با رسیدن به
+MESSAGE_BATCH_SIZE پیام در یک تراکنش ذخیره می‌شوند و سپس رویداد
+message_persisted (تایید ماندگاری) به فرستنده و گیرنده ارسال می‌شود.
+
+هر پیام یک client_id دارد (ساخته شده توسط کلاینت یا سرور). کلاینت پیام‌های
+تایید نشده را نگه می‌دارد و بعد از اتصال مجدد دوباره ارسال می‌کند؛ ذخیره بر
+اساس (sender_id, client_id) یکتا است، پس پیام‌هایی که قبل از crash در صف
+مانده بودند بدون تکرار بازیابی می‌شوند.
+"""
+
+import atexit
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from app.receipts import user_room
+
+PendingMessage = namedtuple('PendingMessage', ['client_id', 'sender_id', 'receiver_id', 'content', 'timestamp'])
+
+
+class MessageWriter:
+    """صف پیام‌های در انتظار ذخیره با group commit"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._started = False
+        self._condition = threading.Condition()
+        self._queue = []
+
+    def init_app(self, app):
+        """خواندن تنظیمات (thread نویسنده در اولین پیام شروع می‌شود)"""
+        self.app = app
+        self.enabled = app.config.get('MESSAGE_WRITE_BEHIND', False)
+        self.flush_interval = app.config.get('MESSAGE_BATCH_INTERVAL', 0.05)
+        self.batch_size = app.config.get('MESSAGE_BATCH_SIZE', 100)
+        if self.enabled:
+            atexit.register(self._flush_on_exit)
+
+    def _start(self):
+        """راه‌اندازی thread نویسنده (باید با قفل صدا زده شود)"""
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._writer_loop, name='message-writer', daemon=True).start()
+
+    def enqueue(self, sender_id, receiver_id, content, client_id=None):
+        """اضافه کردن پیام به صف ذخیره - پیام در انتظار برای انتشار برگردانده می‌شود"""
+        pending = PendingMessage(
+            client_id=client_id or uuid.uuid4().hex,
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            content=content,
+            timestamp=datetime.utcnow()
+        )
+        with self._condition:
+            self._start()
+            self._queue.append(pending)
+            self._condition.notify()
+        return pending
+
+    def _writer_loop(self):
+        """جمع کردن پیام‌ها تا پایان بازه یا پر شدن دسته و سپس ذخیره"""
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+
+            try:
+                with self.app.app_context():
+                    self.write(batch)
+            except Exception as e:
+                print(f"Message batch write failed: {e}")
+
+    def flush(self):
+        """ذخیره فوری تمام پیام‌های صف (برای خاموش شدن برنامه)"""
+        with self._condition:
+            batch, self._queue = self._queue, []
+        if batch:
+            self.write(batch)
+
+    def _flush_on_exit(self):
+        """ذخیره پیام‌های باقیمانده هنگام خروج عادی پروسه"""
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            print(f"Message writer exit flush failed: {e}")
+
+    def write(self, batch):
+        """ذخیره یک دسته در یک تراکنش و ارسال تایید ماندگاری"""
+        from app.extensions import db, socketio
+        from app.services import ChatService
+
+        failed = []
+        try:
+            saved = ChatService.save_messages_batch(batch)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Group commit failed, retrying messages one by one: {e}")
+
+            # یک پیام مشکل‌دار نباید باعث از دست رفتن کل دسته شود
+            saved = []
+            for pending in batch:
+                try:
+                    saved.extend(ChatService.save_messages_batch([pending]))
+                except Exception:
+                    db.session.rollback()
+                    failed.append(pending)
+
+        for pending, message_id in saved:
+            socketio.emit('message_persisted', {
+                'client_id': pending.client_id,
+                'message_id': message_id,
+                'sender_id': pending.sender_id,
+                'receiver_id': pending.receiver_id
+            }, to=[user_room(pending.sender_id), user_room(pending.receiver_id)])
+
+        for pending in failed:
+            socketio.emit('message_failed', {
+                'client_id': pending.client_id
+            }, to=user_room(pending.sender_id))
+
+        return len(saved)
@@ -0,0 +1,4 @@
+"""
+Benchmarks
+ابزار بنچمارک و تست بار برنامه
+"""
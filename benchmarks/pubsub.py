@@ -0,0 +1,129 @@
+"""
+Cross-Process Delivery Check
+بررسی رسیدن رویدادهای اتاق بین دو پروسه از طریق صف پیام Socket.IO
+
+    python -m benchmarks.pubsub
+    python -m benchmarks.pubsub --message-queue redis://localhost:6379/0
+
+دو پروسه سرور (مثل دو worker گانیکورن) با یک دیتابیس و یک
+SOCKETIO_MESSAGE_QUEUE اجرا می‌شوند (پیش‌فرض SQLitePubSubManager روی یک
+فایل موقت). کاربر اول به پروسه اول و کاربر دوم به پروسه دوم وصل می‌شود و
+هر دو وارد اتاق چت مشترک می‌شوند. پیامی که کاربر اول می‌فرستد (new_message)
+و تایپ کاربر دوم (typing) باید به کلاینت متصل به پروسه دیگر برسد؛ در غیر
+این صورت برنامه با کد 1 تمام می‌شود. با --no-queue همین بررسی بدون صف پیام
+اجرا می‌شود و انتظار می‌رود رویدادها نرسند.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench import (bench_config, connect_client, disconnect_all,
+                              parse_args as parse_bench_args, seed, start_server)
+
+DELIVERY_TIMEOUT = 5  # seconds
+
+
+def start_workers(args, env):
+    """اجرای دو پروسه سرور روی دو پورت متوالی"""
+    workers = []
+    try:
+        for offset in range(2):
+            worker_args = argparse.Namespace(**vars(args))
+            worker_args.port = args.port + offset
+            workers.append(start_server(worker_args, env=env))
+    except Exception:
+        stop_workers(workers)
+        raise
+    return workers
+
+
+def stop_workers(workers):
+    for process, _ in workers:
+        process.terminate()
+    for process, _ in workers:
+        process.wait(timeout=10)
+
+
+def expect(client, name):
+    """Event که با رسیدن رویداد name به client تنظیم می‌شود"""
+    received = threading.Event()
+    client.on(name, lambda data: received.set())
+    return received
+
+
+def run(args):
+    from app import create_app
+
+    app = create_app(bench_config(args.database_url))
+    seed(app, args)
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    env = {}
+    if args.message_queue:
+        env['SOCKETIO_MESSAGE_QUEUE'] = args.message_queue
+        print(f'Message queue: {args.message_queue}')
+    else:
+        env['SOCKETIO_MESSAGE_QUEUE'] = ''
+        print('Message queue: none')
+
+    workers = start_workers(args, env)
+    clients = []
+    failures = 0
+    try:
+        (_, first_url), (_, second_url) = workers
+        first = connect_client(first_url, serializer.dumps({'current_user_id': 1}), 2)
+        clients.append(first)
+        second = connect_client(second_url, serializer.dumps({'current_user_id': 2}), 1)
+        clients.append(second)
+
+        new_message = expect(second, 'new_message')
+        typing = expect(first, 'typing')
+
+        # join_chat ها باید قبل از انتشار در هر دو پروسه ثبت شده باشند
+        time.sleep(0.5)
+
+        ack = first.call('send_message', {'other_user_id': 2, 'content': 'cross-process check'},
+                         timeout=DELIVERY_TIMEOUT)
+        second.emit('typing', {'room': 'chat-1-2'})
+
+        checks = [
+            (f'new_message  worker {first_url} -> {second_url}', bool(ack) and new_message.wait(DELIVERY_TIMEOUT)),
+            (f'typing       worker {second_url} -> {first_url}', typing.wait(DELIVERY_TIMEOUT)),
+        ]
+        for name, delivered in checks:
+            ok = delivered != args.no_queue
+            failures += not ok
+            state = 'delivered' if delivered else 'not delivered'
+            print(f"{'ok' if ok else 'FAILED':<7} {name}: {state}")
+    finally:
+        disconnect_all(clients)
+        stop_workers(workers)
+
+    print(f'\n{failures} cross-process checks failed')
+    return failures
+
+
+def main(argv=None):
+    default_db = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'chat-pubsub-check.db')
+    default_queue = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'chat-pubsub-check-queue.db')
+    parser = argparse.ArgumentParser(description='Run two server processes and check cross-process room delivery')
+    parser.add_argument('--database-url', default=default_db)
+    parser.add_argument('--message-queue', default=default_queue, help='SOCKETIO_MESSAGE_QUEUE of both workers')
+    parser.add_argument('--no-queue', action='store_true',
+                        help='run without a message queue and expect events not to cross processes')
+    parser.add_argument('--port', type=int, default=5065)
+    own_args = parser.parse_args(argv)
+
+    args = parse_bench_args(['seed', '--database-url', own_args.database_url, '--port', str(own_args.port),
+                             '--users', '2', '--partners', '1', '--messages', '0'])
+    args.message_queue = None if own_args.no_queue else own_args.message_queue
+    args.no_queue = own_args.no_queue
+    sys.exit(1 if run(args) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Web Push Delivery Check
+بررسی صف ارسال Web Push در برابر یک سرور push محلی
+
+    python -m benchmarks.push
+
+یک سرور HTTP محلی نقش سرویس push مرورگرها را بازی می‌کند و برای هر
+endpoint پاسخ‌های از پیش تعیین شده برمی‌گرداند. اشتراک‌ها با کلیدهای واقعی
+ساخته می‌شوند تا PushDeliveryQueue با همان pywebpush (رمزگذاری aes128gcm و
+امضای VAPID) ارسال کند و سرور متن نوتیفیکیشن را رمزگشایی کند. بررسی‌ها:
+- coalescing: چند پیام یک فرستنده در پنجره coalesce یک نوتیفیکیشن «N پیام
+  جدید» می‌شود و پیام فرستنده دیگر نوتیفیکیشن جدا دارد.
+- retry: پاسخ 5xx با backoff نمایی دوباره ارسال می‌شود تا موفق شود.
+- pruning: اشتراک‌هایی که 404/410 برمی‌گردانند بدون retry حذف می‌شوند.
+در صورت خطا برنامه با کد 1 تمام می‌شود.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.bench import bench_config, parse_args as parse_bench_args, seed
+
+# پاسخ‌های هر endpoint به ترتیب (آخرین پاسخ تکرار می‌شود)
+ENDPOINTS = {
+    'coalesce': [201],
+    'flaky': [503, 502, 201],
+    'gone': [410],
+    'missing': [404],
+}
+# کاربر صاحب هر endpoint
+OWNERS = {'coalesce': 2, 'flaky': 3, 'gone': 3, 'missing': 3}
+BURST = 5
+COALESCE_WINDOW = 0.5
+BACKOFF_BASE = 0.2
+WAIT_TIMEOUT = 15  # seconds
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class FakePushServer:
+    """سرور push محلی با پاسخ‌های از پیش تعیین شده و رمزگشایی payload"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.keys = {}  # name -> (private key, auth secret)
+        self.requests = {name: [] for name in responses}  # name -> [(monotonic time, status, payload)]
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status = server.record(self.path.rsplit('/', 1)[-1], body)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._httpd.serve_forever, name='fake-push', daemon=True).start()
+
+    def subscription(self, name):
+        """اطلاعات اشتراک مرورگر برای endpoint name با کلیدهای تازه"""
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        auth = os.urandom(16)
+        self.keys[name] = (private_key, auth)
+        public_key = private_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+        return {
+            'endpoint': f'http://127.0.0.1:{self._httpd.server_port}/push/{name}',
+            'keys': {'p256dh': b64url(public_key), 'auth': b64url(auth)},
+        }
+
+    def record(self, name, body):
+        """ثبت یک درخواست و انتخاب پاسخ آن"""
+        import http_ece
+
+        with self._lock:
+            if name not in self.requests:
+                return 404
+            received = self.requests[name]
+            status = self.responses[name][min(len(received), len(self.responses[name]) - 1)]
+            private_key, auth = self.keys[name]
+            payload = json.loads(http_ece.decrypt(body, private_key=private_key, auth_secret=auth,
+                                                  version='aes128gcm'))
+            received.append((time.monotonic(), status, payload))
+        return status
+
+    def shutdown(self):
+        self._httpd.shutdown()
+
+
+def push_config(database_url):
+    """تنظیمات بنچمارک با کلید VAPID تازه و زمان‌بندی کوتاه صف"""
+    from py_vapid import Vapid01
+
+    vapid = Vapid01()
+    vapid.generate_keys()
+    private_key = b64url(vapid.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+    class PushConfig(bench_config(database_url)):
+        VAPID_PRIVATE_KEY = private_key
+        VAPID_CLAIM_EMAIL = 'mailto:push-check@example.com'
+        PUSH_COALESCE_WINDOW = COALESCE_WINDOW
+        PUSH_BACKOFF_BASE = BACKOFF_BASE
+        PUSH_PRUNE_DELAY = 0.2
+        PUSH_MAX_RETRIES = 4
+
+    return PushConfig
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run(args):
+    from app import create_app
+    from app.extensions import db, push_queue
+    from app.models import PushSubscription
+    from app.services import NotificationService
+
+    app = create_app(push_config(args.database_url))
+    seed(app, args)
+    server = FakePushServer(ENDPOINTS)
+    checks = []
+
+    def check(name, ok, detail):
+        checks.append(ok)
+        print(f"{'ok' if ok else 'FAILED':<7} {name:<34} {detail}")
+
+    try:
+        with app.app_context():
+            for name, user_id in OWNERS.items():
+                NotificationService.save_subscription(user_id, server.subscription(name))
+
+            for index in range(BURST):
+                NotificationService.queue_notification(2, 'پیام جدید از bench_user_1', f'message {index}',
+                                                       sender_id=1)
+            NotificationService.queue_notification(2, 'پیام جدید از bench_user_3', 'single', sender_id=3)
+            NotificationService.queue_notification(3, 'پیام جدید از bench_user_1', 'to user 3', sender_id=1)
+
+            def remaining_endpoints():
+                db.session.remove()
+                return {endpoint.rsplit('/', 1)[-1]
+                        for endpoint, in db.session.query(PushSubscription.endpoint)}
+
+            settled = wait_for(lambda: len(server.requests['flaky']) >= 3
+                               and remaining_endpoints() == {'coalesce', 'flaky'})
+            endpoints = remaining_endpoints()
+
+        coalesced = sorted(payload['body'] for _, _, payload in server.requests['coalesce'])
+        check('coalesce per sender', coalesced == sorted([f'{BURST} پیام جدید', 'single']),
+              f'{len(coalesced)} pushes for {BURST + 1} messages: {coalesced}')
+
+        flaky = server.requests['flaky']
+        statuses = [status for _, status, _ in flaky]
+        gaps = [later[0] - earlier[0] for earlier, later in zip(flaky, flaky[1:])]
+        backoff = (statuses == [503, 502, 201]
+                   and len(gaps) == 2 and gaps[0] >= BACKOFF_BASE and gaps[1] >= 2 * BACKOFF_BASE)
+        check('retry 5xx with backoff', backoff,
+              f"statuses {statuses}, gaps {', '.join(f'{gap:.2f}s' for gap in gaps)}")
+
+        for name in ('gone', 'missing'):
+            attempts = len(server.requests[name])
+            check(f'prune on {ENDPOINTS[name][0]}', attempts == 1 and name not in endpoints,
+                  f"{attempts} attempt(s), subscription {'kept' if name in endpoints else 'deleted'}")
+        check('keep live subscriptions', {'coalesce', 'flaky'} <= endpoints,
+              f'remaining: {sorted(endpoints)}')
+        if not settled:
+            print(f'        queue did not settle within {WAIT_TIMEOUT}s')
+    finally:
+        server.shutdown()
+
+    failures = checks.count(False)
+    print(f'\n{failures} push delivery checks failed')
+    return failures
+
+
+def main(argv=None):
+    default_db = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'chat-push-check.db')
+    parser = argparse.ArgumentParser(description='Drive the Web Push queue against a local fake push server')
+    parser.add_argument('--database-url', default=default_db)
+    own_args = parser.parse_args(argv)
+
+    args = parse_bench_args(['seed', '--database-url', own_args.database_url,
+                             '--users', '3', '--partners', '1', '--messages', '0'])
+    sys.exit(1 if run(args) else 0)
+
+
+if __name__ == '__main__':
+    main()
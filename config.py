@@ -25,9 +25,43 @@ class Config:
     # SocketIO Configuration
     SOCKETIO_CORS_ALLOWED_ORIGINS = "*"
     SOCKETIO_ASYNC_MODE = 'eventlet'
+    # صف پیام مشترک برای اجرای چند پروسه (app/pubsub.py)
+    # redis://localhost:6379/0 | sqlite:///instance/socketio.db (فقط یک سرور) | خالی: یک پروسه
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    # بدون sticky session (مثلا چند worker گانیکورن) فقط websocket قابل استفاده است
+    SOCKETIO_TRANSPORTS = (
+        ['websocket'] if os.environ.get('SOCKETIO_WEBSOCKET_ONLY', '').lower() in ('1', 'true', 'yes')
+        else ['polling', 'websocket']
+    )
     
-    # Rate Limiting
-    RATELIMIT_STORAGE_URI = "memory://"
+    # Presence (Online Users)
+    # memory: فقط همین پروسه | sqlite: فایل مشترک بین چند worker
+    PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'memory')
+    PRESENCE_DB_PATH = os.environ.get(
+        'PRESENCE_DB_PATH',
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'presence.db')
+    )
+    PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', 90))  # seconds
+    
+    # Profile Cache (نام و تم کاربر جاری)
+    PROFILE_CACHE_SIZE = 4096
+    PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 60))  # seconds
+    
+    # Password Hashing (در thread pool واقعی اجرا می‌شود تا hub eventlet مسدود نشود)
+    # pbkdf2:sha256:<iterations> یا scrypt:<n>:<r>:<p>؛ hash های قدیمی در ورود بعدی به‌روز می‌شوند
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_OFFLOAD = os.environ.get('PASSWORD_HASH_OFFLOAD', '1').lower() in ('1', 'true', 'yes')
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 4))
+    
+    # Rate Limiting (مسیرهای HTTP با limiter.limit و رویدادهای Socket.IO با socket_rate_limit)
+    # memory:// فقط همین پروسه و تا راه‌اندازی مجدد | redis://host:6379/1 مشترک بین worker ها و سرورها
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+    # moving-window: پنجره لغزان دقیق (هر درخواست در بازه محدودیت شمرده می‌شود)
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'moving-window')
+    RATELIMIT_KEY_PREFIX = os.environ.get('RATELIMIT_KEY_PREFIX', 'chat')
+    # در صورت قطع Redis محدودیت‌ها موقتا در حافظه پروسه اعمال می‌شوند
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True
     
     # Major Choices
     MAJOR_CHOICES = [
@@ -36,13 +70,77 @@ class Config:
         ('علوم کامپیوتر', 'علوم کامپیوتر')
     ]
     
+    # User Directory (/match)
+    DIRECTORY_PAGE_SIZE = 24
+    DIRECTORY_FACET_TTL = 300  # seconds
+    TYPEAHEAD_LIMIT = 8
+    TYPEAHEAD_MAX_LIMIT = 20
+    
+    # Page Cache (/inbox، /match و /profile/<id> با کلید نسخه‌دار و ETag)
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    PAGE_CACHE_SIZE = 2048
+    PAGE_CACHE_TTL = 600  # seconds
+    
     # File Upload Configuration
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max file size
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt', 'zip', 'rar'}
     
+    # Image Thumbnails (Pillow)
+    THUMBNAIL_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    THUMBNAIL_SIZES = {'small': 256, 'medium': 512, 'large': 1280}  # max edge in pixels
+    THUMBNAIL_QUALITY = 80
+    
+    # Download Offload
+    # None: ارسال فایل توسط خود برنامه | 'x-accel': nginx | 'x-sendfile': Apache/lighttpd
+    # برای nginx یک location داخلی لازم است:
+    #   location /protected-uploads/ { internal; alias /path/to/uploads/; }
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD') or None
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    USE_X_SENDFILE = DOWNLOAD_OFFLOAD == 'x-sendfile'
+    
+    # Chunked Uploads (هر تکه یک درخواست جداگانه است و زیر MAX_CONTENT_LENGTH می‌ماند)
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+    UPLOAD_MAX_SIZE = 100 * 1024 * 1024  # 100 MB
+    UPLOAD_PARTIAL_TTL = 24 * 60 * 60  # seconds
+    
     # VAPID Keys for Web Push (Generate new ones for production!)
     # Generate keys: python -c "from py_vapid import Vapid; v = Vapid(); v.generate_keys(); print('Public:', v.public_key_bytes); print('Private:', v.private_key)"
     VAPID_PUBLIC_KEY = os.environ.get('VAPID_PUBLIC_KEY', '')
     VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY', '')
-    VAPID_CLAIM_EMAIL = os.environ.get('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
\ No newline at end of file
+    VAPID_CLAIM_EMAIL = os.environ.get('VAPID_CLAIM_EMAIL', 'mailto:admin@example.com')
+    
+    # Web Push Delivery Queue
+    PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', 4))
+    PUSH_QUEUE_SIZE = 1000
+    PUSH_COALESCE_WINDOW = 3.0  # seconds
+    PUSH_MAX_RETRIES = 4
+    PUSH_BACKOFF_BASE = 2.0  # seconds
+    PUSH_PRUNE_DELAY = 5.0  # seconds
+    
+    # Read Receipts (رویدادهای mark_read در این بازه جمع و یک‌جا ثبت می‌شوند)
+    READ_RECEIPT_FLUSH_INTERVAL = 0.5  # seconds
+    
+    # Typing Indicator (فقط تغییر وضعیت ارسال می‌شود؛ بدون stop_typing بعد از TYPING_TIMEOUT منقضی می‌شود)
+    TYPING_TIMEOUT = 5.0  # seconds
+    TYPING_MIN_INTERVAL = 1.0  # seconds، حداقل فاصله دو شروع تایپ برای هر کاربر و اتاق
+    
+    # Write-Behind Messages (پیام‌ها قبل از ذخیره منتشر و به صورت دسته‌ای commit می‌شوند)
+    MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    MESSAGE_BATCH_INTERVAL = 0.05  # seconds
+    MESSAGE_BATCH_SIZE = 100
+    
+    # Message Archive (app/archive.py)
+    # پیام‌های قدیمی به message_archive منتقل و پیام‌های حذف شده بعد از مدتی کاملا پاک می‌شوند
+    MESSAGE_ARCHIVE_ENABLED = os.environ.get('MESSAGE_ARCHIVE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180))
+    # tombstone حذف برای sync کلاینت‌های آفلاین تا این مدت نگه داشته می‌شود
+    MESSAGE_PURGE_AFTER_DAYS = int(os.environ.get('MESSAGE_PURGE_AFTER_DAYS', 30))
+    MESSAGE_ARCHIVE_INTERVAL = 3600  # seconds
+    MESSAGE_ARCHIVE_BATCH_SIZE = 5000
+    
+    # Instrumentation (آمار هر endpoint و رویداد در /metrics با فرمت Prometheus)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None  # Authorization: Bearer <token>
+    METRICS_SLOW_THRESHOLD = float(os.environ.get('METRICS_SLOW_THRESHOLD', 0.5))  # seconds
+    METRICS_SLOW_SQL_LIMIT = 20  # کوئری‌های نگه داشته شده برای لاگ عملیات کند
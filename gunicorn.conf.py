@@ -0,0 +1,44 @@
+"""
+Gunicorn Configuration
+اجرای production با worker های eventlet
+
+    gunicorn -c gunicorn.conf.py app:app
+
+چند worker (WEB_CONCURRENCY > 1) فقط با این شرایط درست کار می‌کند:
+- SOCKETIO_MESSAGE_QUEUE تنظیم شده باشد تا emit به اتاق‌ها به کلاینت‌های
+  تمام workerها برسد (redis://... یا sqlite:///... روی یک سرور).
+- load balancer داخلی گانیکورن sticky نیست؛ پس یا SOCKETIO_WEBSOCKET_ONLY=1
+  (هر اتصال websocket فقط یک درخواست است)، یا هر worker روی پورت جدا و
+  یک reverse proxy با sticky session (مثلا nginx با ip_hash) جلوی آن‌ها.
+- PRESENCE_BACKEND=sqlite تا وضعیت آنلاین بین workerها مشترک باشد.
+- RATELIMIT_STORAGE_URI=redis://... تا محدودیت نرخ بین workerها مشترک باشد.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = 'eventlet'
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+timeout = 60
+graceful_timeout = 30
+accesslog = '-'
+
+
+def on_starting(server):
+    """هشدار برای تنظیمات ناقص اجرای چند worker"""
+    if workers <= 1:
+        return
+
+    if not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        server.log.warning('WEB_CONCURRENCY > 1 without SOCKETIO_MESSAGE_QUEUE: '
+                           'room events will not reach clients on other workers')
+    if os.environ.get('SOCKETIO_WEBSOCKET_ONLY', '').lower() not in ('1', 'true', 'yes'):
+        server.log.warning('WEB_CONCURRENCY > 1 without SOCKETIO_WEBSOCKET_ONLY: '
+                           'long-polling clients need sticky sessions')
+    if os.environ.get('RATELIMIT_STORAGE_URI', 'memory://').startswith('memory://'):
+        server.log.warning('WEB_CONCURRENCY > 1 with in-memory rate limits: '
+                           'limits are per worker')
+    if os.environ.get('PRESENCE_BACKEND', 'memory') == 'memory':
+        server.log.warning('WEB_CONCURRENCY > 1 with in-memory presence: '
+                           'online status is per worker')
@@ -0,0 +1,94 @@
+"""Add conversation summary table for inbox rendering
+
+Revision ID: 3f9a2c71d4b8
+Revises: 1c7ab1312c78
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c71d4b8'
+down_revision = '1c7ab1312c78'
+branch_labels = None
+depends_on = None
+
+
+PREVIEW_LENGTH = 200
+
+
+def upgrade():
+    op.create_table('conversation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_lo_id', sa.Integer(), nullable=False),
+    sa.Column('user_hi_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_preview', sa.String(length=200), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('unread_lo', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('unread_hi', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['last_message_id'], ['message.id'], ),
+    sa.ForeignKeyConstraint(['user_hi_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_lo_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_lo_id', 'user_hi_id', name='uq_conversation_pair')
+    )
+    op.create_index('idx_conversation_lo_last', 'conversation', ['user_lo_id', 'last_message_at'], unique=False)
+    op.create_index('idx_conversation_hi_last', 'conversation', ['user_hi_id', 'last_message_at'], unique=False)
+
+    # پر کردن جدول از روی پیام‌های موجود
+    message = sa.table('message',
+        sa.column('id', sa.Integer),
+        sa.column('sender_id', sa.Integer),
+        sa.column('receiver_id', sa.Integer),
+        sa.column('content', sa.Text),
+        sa.column('timestamp', sa.DateTime),
+        sa.column('read_at', sa.DateTime),
+        sa.column('is_deleted', sa.Boolean),
+    )
+    conversation = sa.table('conversation',
+        sa.column('user_lo_id', sa.Integer),
+        sa.column('user_hi_id', sa.Integer),
+        sa.column('last_message_id', sa.Integer),
+        sa.column('last_message_preview', sa.String),
+        sa.column('last_message_at', sa.DateTime),
+        sa.column('unread_lo', sa.Integer),
+        sa.column('unread_hi', sa.Integer),
+    )
+
+    user_lo = sa.case((message.c.sender_id < message.c.receiver_id, message.c.sender_id), else_=message.c.receiver_id)
+    user_hi = sa.case((message.c.sender_id < message.c.receiver_id, message.c.receiver_id), else_=message.c.sender_id)
+    unread = message.c.read_at.is_(None)
+
+    summary = sa.select(
+        user_lo.label('user_lo_id'),
+        user_hi.label('user_hi_id'),
+        sa.func.max(message.c.id).label('last_message_id'),
+        sa.func.sum(sa.case((sa.and_(unread, message.c.receiver_id == user_lo), 1), else_=0)).label('unread_lo'),
+        sa.func.sum(sa.case((sa.and_(unread, message.c.receiver_id == user_hi), 1), else_=0)).label('unread_hi'),
+    ).where(
+        sa.func.coalesce(message.c.is_deleted, sa.false()) == sa.false()
+    ).group_by(user_lo, user_hi)
+
+    bind = op.get_bind()
+    for row in bind.execute(summary).fetchall():
+        last = bind.execute(
+            sa.select(message.c.content, message.c.timestamp).where(message.c.id == row.last_message_id)
+        ).first()
+        bind.execute(conversation.insert().values(
+            user_lo_id=row.user_lo_id,
+            user_hi_id=row.user_hi_id,
+            last_message_id=row.last_message_id,
+            last_message_preview=last.content[:PREVIEW_LENGTH],
+            last_message_at=last.timestamp,
+            unread_lo=row.unread_lo or 0,
+            unread_hi=row.unread_hi or 0,
+        ))
+
+
+def downgrade():
+    op.drop_index('idx_conversation_hi_last', table_name='conversation')
+    op.drop_index('idx_conversation_lo_last', table_name='conversation')
+    op.drop_table('conversation')
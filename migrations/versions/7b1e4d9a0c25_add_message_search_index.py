@@ -0,0 +1,102 @@
+"""Add full-text search index for messages
+
+Revision ID: 7b1e4d9a0c25
+Revises: 3f9a2c71d4b8
+Create Date: 2026-10-18 10:03:54.118520
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b1e4d9a0c25'
+down_revision = '3f9a2c71d4b8'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+# کپی ثابت app.search.normalize_text در زمان این migration؛ تغییرات بعدی
+# نرمال‌سازی نباید نتیجه اجرای این migration را عوض کند
+_CHAR_MAP = str.maketrans({
+    '\u064a': '\u06cc',  # ي -> ی
+    '\u0649': '\u06cc',  # ى -> ی
+    '\u0643': '\u06a9',  # ك -> ک
+    '\u0629': '\u0647',  # ة -> ه
+    '\u06c0': '\u0647',  # ۀ -> ه
+    '\u0623': '\u0627',  # أ -> ا
+    '\u0625': '\u0627',  # إ -> ا
+    '\u0671': '\u0627',  # ٱ -> ا
+    '\u200c': ' ',       # نیم‌فاصله (ZWNJ)
+    '\u200d': None,      # ZWJ
+    '\u200e': None,      # LRM
+    '\u200f': None,      # RLM
+    '\u0640': None,      # کشیده
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value.translate(_CHAR_MAP))
+    return ' '.join(value.lower().split())
+
+
+def upgrade():
+    op.add_column('message', sa.Column('search_text', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+
+    # پر کردن متن نرمال شده برای پیام‌های موجود
+    message = sa.table('message',
+        sa.column('id', sa.Integer),
+        sa.column('content', sa.Text),
+        sa.column('search_text', sa.Text),
+        sa.column('is_deleted', sa.Boolean),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(message.c.id, message.c.content).where(
+                message.c.id > last_id,
+                sa.func.coalesce(message.c.is_deleted, sa.false()) == sa.false()
+            ).order_by(message.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            bind.execute(
+                message.update().where(message.c.id == row.id).values(search_text=normalize_text(row.content))
+            )
+        last_id = rows[-1].id
+
+    if dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX idx_message_search ON message "
+            "USING gin (to_tsvector('simple'::regconfig, search_text))"
+        )
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE message_fts USING fts5(search_text, tokenize='unicode61')")
+        op.execute(
+            "INSERT INTO message_fts (rowid, search_text) "
+            "SELECT id, search_text FROM message WHERE search_text IS NOT NULL"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS idx_message_search')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS message_fts')
+
+    op.drop_column('message', 'search_text')
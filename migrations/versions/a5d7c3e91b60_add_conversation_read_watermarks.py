@@ -0,0 +1,57 @@
+"""Add per-conversation read watermarks for batched read receipts
+
+Revision ID: a5d7c3e91b60
+Revises: e8a3b6f20d14
+Create Date: 2026-10-18 12:41:07.552903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d7c3e91b60'
+down_revision = 'e8a3b6f20d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_lo_id', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('last_read_hi_id', sa.Integer(), nullable=False, server_default='0'))
+
+    # watermark اولیه: آخرین پیام خوانده شده از طرف مقابل
+    message = sa.table('message',
+        sa.column('id', sa.Integer),
+        sa.column('sender_id', sa.Integer),
+        sa.column('receiver_id', sa.Integer),
+        sa.column('read_at', sa.DateTime),
+    )
+    conversation = sa.table('conversation',
+        sa.column('user_lo_id', sa.Integer),
+        sa.column('user_hi_id', sa.Integer),
+        sa.column('last_read_lo_id', sa.Integer),
+        sa.column('last_read_hi_id', sa.Integer),
+    )
+
+    def last_read(reader, sender):
+        return sa.func.coalesce(
+            sa.select(sa.func.max(message.c.id)).where(
+                message.c.receiver_id == reader,
+                message.c.sender_id == sender,
+                message.c.read_at.isnot(None)
+            ).scalar_subquery(),
+            0
+        )
+
+    op.execute(conversation.update().values(
+        last_read_lo_id=last_read(conversation.c.user_lo_id, conversation.c.user_hi_id),
+        last_read_hi_id=last_read(conversation.c.user_hi_id, conversation.c.user_lo_id),
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_read_hi_id')
+        batch_op.drop_column('last_read_lo_id')
@@ -0,0 +1,108 @@
+"""Add message archive table and deleted_at
+
+Revision ID: b6f2d8e1a4c7
+Revises: e4b7d2a95c18
+Create Date: 2026-10-18 18:42:05.913264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f2d8e1a4c7'
+down_revision = 'e4b7d2a95c18'
+branch_labels = None
+depends_on = None
+
+
+def _where(sqlite_clause, postgresql_clause):
+    return {'sqlite_where': sa.text(sqlite_clause), 'postgresql_where': sa.text(postgresql_clause)}
+
+
+LIVE = _where('is_deleted = 0', 'is_deleted = false')
+UNREAD = _where('read_at IS NULL AND is_deleted = 0', 'read_at IS NULL AND is_deleted = false')
+DELETED = _where('is_deleted = 1', 'is_deleted = true')
+
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+
+    op.add_column('message', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # زمان حذف پیام‌های حذف شده قبلی نامعلوم است؛ مهلت پاک‌سازی از همین حالا شروع می‌شود
+    message = sa.table('message', sa.column('is_deleted', sa.Boolean), sa.column('deleted_at', sa.DateTime))
+    bind.execute(message.update().where(message.c.is_deleted == True).values(deleted_at=sa.func.now()))
+
+    # روی PostgreSQL پارتیشن‌های ماهانه هنگام بایگانی ساخته می‌شوند (app/archive.py)
+    op.create_table('message_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('receiver_id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.Column('edited_at', sa.DateTime(), nullable=True),
+    sa.Column('is_deleted', sa.Boolean(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('file_name', sa.String(length=255), nullable=True),
+    sa.Column('file_type', sa.String(length=50), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('file_hash', sa.String(length=64), nullable=True),
+    sa.Column('search_text', sa.Text(), nullable=True),
+    sa.Column('client_id', sa.String(length=36), nullable=True),
+    sa.Column('seq', sa.Integer(), nullable=True),
+    sa.Column('user_lo_id', sa.Integer(), nullable=True),
+    sa.Column('user_hi_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['file_hash'], ['file_blob.sha256'], ),
+    sa.ForeignKeyConstraint(['receiver_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['sender_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id', 'timestamp'),
+    postgresql_partition_by='RANGE (timestamp)'
+    )
+    op.create_index('idx_message_archive_conversation_live', 'message_archive',
+                    ['user_lo_id', 'user_hi_id', 'timestamp', 'id'], unique=False, **LIVE)
+    op.create_index('idx_message_archive_unread', 'message_archive',
+                    ['receiver_id', 'sender_id', 'id'], unique=False, **UNREAD)
+    op.create_index('idx_message_archive_conversation_seq', 'message_archive',
+                    ['user_lo_id', 'user_hi_id', 'seq'], unique=False)
+    op.create_index('idx_message_archive_deleted', 'message_archive', ['deleted_at'], unique=False, **DELETED)
+    op.create_index(op.f('ix_message_archive_file_hash'), 'message_archive', ['file_hash'], unique=False)
+
+    if dialect == 'postgresql':
+        op.execute("CREATE INDEX idx_message_archive_search ON message_archive "
+                   "USING gin (to_tsvector('simple'::regconfig, search_text))")
+        # آخرین پیام مکالمه ممکن است بعد از حذف پیام‌های اخیر یک پیام بایگانی شده باشد
+        # (روی SQLite کلید خارجی اجرا نمی‌شود و تغییری لازم نیست)
+        op.execute('ALTER TABLE conversation DROP CONSTRAINT IF EXISTS conversation_last_message_id_fkey')
+        with op.get_context().autocommit_block():
+            op.create_index('idx_message_deleted', 'message', ['deleted_at'], unique=False,
+                            postgresql_concurrently=True, **DELETED)
+            op.create_index('idx_conversation_last_message', 'conversation', ['last_message_id'], unique=False,
+                            postgresql_concurrently=True)
+    else:
+        op.create_index('idx_message_deleted', 'message', ['deleted_at'], unique=False, **DELETED)
+        op.create_index('idx_conversation_last_message', 'conversation', ['last_message_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    # برگرداندن پیام‌های بایگانی شده به message قبل از حذف جدول
+    columns = ', '.join([
+        'id', 'sender_id', 'receiver_id', 'content', 'timestamp', 'read_at', 'edited_at', 'is_deleted',
+        'file_path', 'file_name', 'file_type', 'file_size', 'file_hash', 'search_text', 'client_id', 'seq',
+        'user_lo_id', 'user_hi_id',
+    ])
+    op.execute(f'INSERT INTO message ({columns}) SELECT {columns} FROM message_archive')
+
+    op.drop_index('idx_conversation_last_message', table_name='conversation')
+    op.drop_index('idx_message_deleted', table_name='message')
+    if bind.dialect.name == 'postgresql':
+        op.create_foreign_key('conversation_last_message_id_fkey', 'conversation', 'message',
+                              ['last_message_id'], ['id'])
+    op.drop_table('message_archive')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
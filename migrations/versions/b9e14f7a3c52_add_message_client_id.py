@@ -0,0 +1,27 @@
+"""Add client-generated message id for idempotent write-behind persistence
+
+Revision ID: b9e14f7a3c52
+Revises: a5d7c3e91b60
+Create Date: 2026-10-18 13:18:44.209156
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e14f7a3c52'
+down_revision = 'a5d7c3e91b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('message', sa.Column('client_id', sa.String(length=36), nullable=True))
+    op.create_index('uq_message_sender_client', 'message', ['sender_id', 'client_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_message_sender_client', table_name='message')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('client_id')
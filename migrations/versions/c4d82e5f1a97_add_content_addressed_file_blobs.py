@@ -0,0 +1,42 @@
+"""Add content-addressed file blobs with reference counting
+
+Revision ID: c4d82e5f1a97
+Revises: 7b1e4d9a0c25
+Create Date: 2026-10-18 11:27:09.664301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d82e5f1a97'
+down_revision = '7b1e4d9a0c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_blob',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('file_size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('message', sa.Column('file_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_message_file_hash'), 'message', ['file_hash'], unique=False)
+
+    # SQLite از اضافه کردن foreign key با ALTER پشتیبانی نمی‌کند
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_foreign_key('fk_message_file_hash', 'message', 'file_blob', ['file_hash'], ['sha256'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_message_file_hash', 'message', type_='foreignkey')
+
+    op.drop_index(op.f('ix_message_file_hash'), table_name='message')
+    op.drop_column('message', 'file_hash')
+    op.drop_table('file_blob')
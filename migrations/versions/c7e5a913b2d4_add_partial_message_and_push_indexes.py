@@ -0,0 +1,62 @@
+"""Add partial message indexes and push subscription indexes
+
+Revision ID: c7e5a913b2d4
+Revises: a8c2f47d9e15
+Create Date: 2026-10-18 17:21:36.402518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e5a913b2d4'
+down_revision = 'a8c2f47d9e15'
+branch_labels = None
+depends_on = None
+
+
+def _where(sqlite_clause, postgresql_clause):
+    return {'sqlite_where': sa.text(sqlite_clause), 'postgresql_where': sa.text(postgresql_clause)}
+
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+
+    # پیام‌های قدیمی (قبل از ستون is_deleted) در غیر این صورت از ایندکس‌های جزئی حذف می‌شوند
+    message = sa.table('message', sa.column('is_deleted', sa.Boolean))
+    bind.execute(message.update().where(message.c.is_deleted.is_(None)).values(is_deleted=False))
+
+    indexes = [
+        ('idx_message_pair_live', 'message', ['sender_id', 'receiver_id', 'timestamp', 'id'],
+         _where('is_deleted = 0', 'is_deleted = false')),
+        ('idx_message_unread', 'message', ['receiver_id', 'sender_id', 'id'],
+         _where('read_at IS NULL AND is_deleted = 0', 'read_at IS NULL AND is_deleted = false')),
+    ]
+    # جدول push_subscription در migration ها ساخته نشده و در برخی نصب‌ها با create_all ساخته شده است
+    if sa.inspect(bind).has_table('push_subscription'):
+        indexes += [
+            ('idx_push_subscription_user_endpoint', 'push_subscription', ['user_id', 'endpoint'], {}),
+            ('idx_push_subscription_endpoint', 'push_subscription', ['endpoint'], {}),
+        ]
+
+    if dialect == 'postgresql':
+        # ساخت ایندکس بدون قفل کردن نوشتن روی جدول‌های بزرگ
+        with op.get_context().autocommit_block():
+            for name, table, columns, kwargs in indexes:
+                op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **kwargs)
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS idx_sender_receiver_timestamp')
+    else:
+        for name, table, columns, kwargs in indexes:
+            op.create_index(name, table, columns, unique=False, **kwargs)
+        # جایگزین شده با idx_message_pair_live
+        op.execute('DROP INDEX IF EXISTS idx_sender_receiver_timestamp')
+
+
+def downgrade():
+    op.create_index('idx_sender_receiver_timestamp', 'message', ['sender_id', 'receiver_id', 'timestamp'], unique=False)
+    op.execute('DROP INDEX IF EXISTS idx_push_subscription_endpoint')
+    op.execute('DROP INDEX IF EXISTS idx_push_subscription_user_endpoint')
+    op.drop_index('idx_message_unread', table_name='message')
+    op.drop_index('idx_message_pair_live', table_name='message')
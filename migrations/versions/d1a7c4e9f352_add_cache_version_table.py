@@ -0,0 +1,28 @@
+"""Add cache version table for versioned page cache keys
+
+Revision ID: d1a7c4e9f352
+Revises: b6f2d8e1a4c7
+Create Date: 2026-10-18 19:27:51.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1a7c4e9f352'
+down_revision = 'b6f2d8e1a4c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
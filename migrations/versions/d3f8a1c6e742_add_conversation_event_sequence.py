@@ -0,0 +1,60 @@
+"""Add per-conversation event sequence for delta sync
+
+Revision ID: d3f8a1c6e742
+Revises: b9e14f7a3c52
+Create Date: 2026-10-18 14:02:36.871540
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a1c6e742'
+down_revision = 'b9e14f7a3c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('message', sa.Column('seq', sa.Integer(), nullable=True))
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seq', sa.Integer(), nullable=False, server_default='0'))
+
+    # پیام‌های موجود: شناسه پیام به عنوان شماره رویداد (در هر مکالمه صعودی است)
+    message = sa.table('message',
+        sa.column('id', sa.Integer),
+        sa.column('sender_id', sa.Integer),
+        sa.column('receiver_id', sa.Integer),
+        sa.column('seq', sa.Integer),
+    )
+    conversation = sa.table('conversation',
+        sa.column('user_lo_id', sa.Integer),
+        sa.column('user_hi_id', sa.Integer),
+        sa.column('last_seq', sa.Integer),
+    )
+
+    op.execute(message.update().values(seq=message.c.id))
+    op.execute(conversation.update().values(
+        last_seq=sa.func.coalesce(
+            sa.select(sa.func.max(message.c.id)).where(
+                sa.or_(
+                    sa.and_(message.c.sender_id == conversation.c.user_lo_id,
+                            message.c.receiver_id == conversation.c.user_hi_id),
+                    sa.and_(message.c.sender_id == conversation.c.user_hi_id,
+                            message.c.receiver_id == conversation.c.user_lo_id)
+                )
+            ).scalar_subquery(),
+            0
+        )
+    ))
+
+    op.create_index('idx_sender_receiver_seq', 'message', ['sender_id', 'receiver_id', 'seq'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_sender_receiver_seq', table_name='message')
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_column('last_seq')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('seq')
@@ -0,0 +1,77 @@
+"""Add conversation key to messages
+
+Revision ID: e4b7d2a95c18
+Revises: c7e5a913b2d4
+Create Date: 2026-10-18 17:58:40.227913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7d2a95c18'
+down_revision = 'c7e5a913b2d4'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.add_column('message', sa.Column('user_lo_id', sa.Integer(), nullable=True))
+    op.add_column('message', sa.Column('user_hi_id', sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+
+    # پر کردن کلید مکالمه پیام‌های موجود در بازه‌های کلید اصلی
+    message = sa.table('message',
+        sa.column('id', sa.Integer),
+        sa.column('sender_id', sa.Integer),
+        sa.column('receiver_id', sa.Integer),
+        sa.column('user_lo_id', sa.Integer),
+        sa.column('user_hi_id', sa.Integer),
+    )
+    lower_sender = message.c.sender_id < message.c.receiver_id
+    max_id = bind.execute(sa.select(sa.func.max(message.c.id))).scalar() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        bind.execute(
+            message.update()
+            .where(message.c.id > start, message.c.id <= start + BATCH_SIZE)
+            .values(
+                user_lo_id=sa.case((lower_sender, message.c.sender_id), else_=message.c.receiver_id),
+                user_hi_id=sa.case((lower_sender, message.c.receiver_id), else_=message.c.sender_id),
+            )
+        )
+
+    live = {'sqlite_where': sa.text('is_deleted = 0'), 'postgresql_where': sa.text('is_deleted = false')}
+    indexes = [
+        ('idx_message_conversation_live', ['user_lo_id', 'user_hi_id', 'timestamp', 'id'], live),
+        ('idx_message_conversation_seq', ['user_lo_id', 'user_hi_id', 'seq'], {}),
+    ]
+    replaced = ['idx_message_pair_live', 'idx_sender_receiver_seq']
+
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, columns, kwargs in indexes:
+                op.create_index(name, 'message', columns, unique=False, postgresql_concurrently=True, **kwargs)
+            for name in replaced:
+                op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    else:
+        for name, columns, kwargs in indexes:
+            op.create_index(name, 'message', columns, unique=False, **kwargs)
+        for name in replaced:
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def downgrade():
+    op.create_index('idx_sender_receiver_seq', 'message', ['sender_id', 'receiver_id', 'seq'], unique=False)
+    op.create_index('idx_message_pair_live', 'message', ['sender_id', 'receiver_id', 'timestamp', 'id'],
+                    unique=False, sqlite_where=sa.text('is_deleted = 0'),
+                    postgresql_where=sa.text('is_deleted = false'))
+    op.drop_index('idx_message_conversation_seq', table_name='message')
+    op.drop_index('idx_message_conversation_live', table_name='message')
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_column('user_hi_id')
+        batch_op.drop_column('user_lo_id')
@@ -0,0 +1,28 @@
+"""Add image dimensions to file blobs for thumbnails
+
+Revision ID: e8a3b6f20d14
+Revises: c4d82e5f1a97
+Create Date: 2026-10-18 12:04:51.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a3b6f20d14'
+down_revision = 'c4d82e5f1a97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('file_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('file_blob', schema=None) as batch_op:
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
@@ -0,0 +1,90 @@
+"""Add normalized user name and directory indexes
+
+Revision ID: f1c9e2b84a37
+Revises: d3f8a1c6e742
+Create Date: 2026-10-18 14:47:12.093318
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c9e2b84a37'
+down_revision = 'd3f8a1c6e742'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+# کپی ثابت app.search.normalize_text در زمان این migration؛ تغییرات بعدی
+# نرمال‌سازی نباید نتیجه اجرای این migration را عوض کند
+_CHAR_MAP = str.maketrans({
+    '\u064a': '\u06cc',  # ي -> ی
+    '\u0649': '\u06cc',  # ى -> ی
+    '\u0643': '\u06a9',  # ك -> ک
+    '\u0629': '\u0647',  # ة -> ه
+    '\u06c0': '\u0647',  # ۀ -> ه
+    '\u0623': '\u0627',  # أ -> ا
+    '\u0625': '\u0627',  # إ -> ا
+    '\u0671': '\u0627',  # ٱ -> ا
+    '\u200c': ' ',       # نیم‌فاصله (ZWNJ)
+    '\u200d': None,      # ZWJ
+    '\u200e': None,      # LRM
+    '\u200f': None,      # RLM
+    '\u0640': None,      # کشیده
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+
+
+def normalize_text(value):
+    if not value:
+        return ''
+    value = _DIACRITICS.sub('', value.translate(_CHAR_MAP))
+    return ' '.join(value.lower().split())
+
+
+def upgrade():
+    op.add_column('user', sa.Column('search_name', sa.String(length=100), nullable=True))
+
+    bind = op.get_bind()
+
+    # پر کردن نام نرمال شده برای کاربران موجود
+    user = sa.table('user',
+        sa.column('id', sa.Integer),
+        sa.column('name', sa.String),
+        sa.column('search_name', sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(user.c.id, user.c.name).where(user.c.id > last_id).order_by(user.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            bind.execute(user.update().where(user.c.id == row.id).values(search_name=normalize_text(row.name)))
+        last_id = rows[-1].id
+
+    op.create_index('idx_user_search_name', 'user', ['search_name', 'id'], unique=False)
+    op.create_index('idx_user_major_search_name', 'user', ['major', 'search_name', 'id'], unique=False)
+
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX idx_user_search_name_trgm ON "user" USING gin (search_name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS idx_user_search_name_trgm')
+
+    op.drop_index('idx_user_major_search_name', table_name='user')
+    op.drop_index('idx_user_search_name', table_name='user')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('search_name')
@@ -41,9 +41,10 @@ function initFileUpload() {
         const file = e.target.files[0];
         if (!file) return;
 
-        // بررسی سایز فایل (16MB max)
-        if (file.size > 16 * 1024 * 1024) {
-            alert('حجم فایل نباید بیشتر از 16 مگابایت باشد');
+        // بررسی سایز فایل
+        const maxSize = window.UPLOAD_MAX_SIZE || 16 * 1024 * 1024;
+        if (file.size > maxSize) {
+            alert(`حجم فایل نباید بیشتر از ${Math.round(maxSize / (1024 * 1024))} مگابایت باشد`);
             fileInput.value = '';
             return;
         }
@@ -101,6 +102,55 @@ function formatFileSize(bytes) {
     return (bytes / (1024 * 1024)).toFixed(1) + ' MB';
 }
 
+// ==================== Chunked Upload ====================
+// آپلود تکه‌ای با امکان ادامه بعد از قطع اتصال - بازگشت upload_id
+async function uploadFileChunked(file, onProgress) {
+    const initResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ file_name: file.name, file_size: file.size })
+    });
+    const upload = await initResponse.json();
+    if (!upload.success) throw new Error(upload.error);
+    
+    let offset = upload.offset;
+    let retries = 0;
+    
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        try {
+            const response = await fetch(`/api/uploads/${upload.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                headers: {
+                    'Content-Type': 'application/octet-stream'
+                },
+                body: chunk
+            });
+            const data = await response.json();
+            if (!data.success) throw new Error(data.error);
+            offset = data.offset;
+            retries = 0;
+        } catch (error) {
+            if (++retries > 5) throw error;
+            
+            // صبر و دریافت offset ذخیره شده از سرور برای ادامه آپلود
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            try {
+                const status = await (await fetch(`/api/uploads/${upload.upload_id}`)).json();
+                if (status.success) offset = status.offset;
+            } catch (statusError) {
+                console.error('Error checking upload status:', statusError);
+            }
+        }
+        
+        if (onProgress) onProgress(offset / file.size);
+    }
+    
+    return upload.upload_id;
+}
+
 // ==================== Message Edit/Delete ====================
 function initMessageActions() {
     document.addEventListener('click', (e) => {